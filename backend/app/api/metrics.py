@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+
+from app.auth import get_current_user
+from app.services.answer_cache import answer_cache
+from app.rag.embed_cache import embed_cache
+from app.rag.upsert_pipeline import upsert_pipeline
+from app.services.retrieval_planner import planner_stats
+from app.services.model_registry import model_registry
+from app.services.prediction_batcher import prediction_batcher
+from app.services.prediction_cache import prediction_cache
+
+router = APIRouter(prefix="/api/metrics", tags=["Metrics"])
+
+
+@router.get("")
+def metrics(user=Depends(get_current_user)):
+    return {
+        "answer_cache": answer_cache.stats(),
+        "embed_cache": embed_cache.stats(),
+        "ingest": upsert_pipeline.stats(),
+        "retrieval": planner_stats(),
+        "models": model_registry.info(),
+        "ml_batching": prediction_batcher.stats(),
+        "ml_cache": prediction_cache.stats(),
+    }
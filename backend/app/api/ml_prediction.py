@@ -1,48 +1,65 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-import os, joblib
-import numpy as np
 
 from app.auth import get_current_user
+from app.config import settings
+from app.services.ml_predictor import predict_top_batch, symptoms_to_text
+from app.services.prediction_batcher import prediction_batcher
+from app.services.prediction_cache import prediction_cache
 
 router = APIRouter(prefix="/symptom", tags=["ML Prediction"])
 
-# ---- Load pkl files from backend root ----
-#BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
-BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-MODEL_PATH = os.path.join(BACKEND_DIR, "disease_model.pkl")
-VECTORIZER_PATH = os.path.join(BACKEND_DIR, "vectorizer.pkl")
-ENCODER_PATH = os.path.join(BACKEND_DIR, "label_encoder.pkl")
-
-model = joblib.load(MODEL_PATH)
-vectorizer = joblib.load(VECTORIZER_PATH)
-label_encoder = joblib.load(ENCODER_PATH)
+# model / vectorizer / label encoder: loaded once per process, on first
+# request, by app.services.model_registry (shared with ml_predictor)
 
 class MLIn(BaseModel):
     symptoms: List[str]
     top_k: Optional[int] = 5
 
+class MLBatchIn(BaseModel):
+    symptom_sets: List[List[str]]
+    top_k: Optional[int] = 5
+
+def _clamp_k(top_k: Optional[int]) -> int:
+    return max(1, min(int(top_k or 5), 10))
+
 @router.post("/predict-ml")
-def predict_ml(body: MLIn, user=Depends(get_current_user)):
-    # selected symptoms -> single text
-    text = ", ".join([s.strip().lower() for s in body.symptoms if s and s.strip()])
-    X = vectorizer.transform([text])
-
-    if hasattr(model, "predict_proba"):
-        probs = model.predict_proba(X)[0]
-        k = max(1, min(int(body.top_k or 5), 10))
-        top_idx = np.argsort(probs)[::-1][:k]
-
-        diseases = label_encoder.inverse_transform(top_idx)
-        preds = [
-            {"disease": str(d), "confidence": round(float(probs[i]), 4)}
-            for d, i in zip(diseases, top_idx)
-        ]
-        return {"predictions": preds}
-
-    # fallback
-    pred = model.predict(X)[0]
-    disease = label_encoder.inverse_transform([pred])[0]
-    return {"predictions": [{"disease": str(disease), "confidence": None}]}
+async def predict_ml(body: MLIn, user=Depends(get_current_user)):
+    # ✅ concurrent calls are scored together (app.services.prediction_batcher)
+    k = _clamp_k(body.top_k)
+    text = symptoms_to_text(body.symptoms)
+
+    # ✅ same symptom set + top_k + model version -> no model call
+    preds, generation = prediction_cache.get(text, k)
+    if preds is None:
+        preds = await prediction_batcher.predict(text, k)
+        prediction_cache.put(text, k, preds, generation)
+    return {"predictions": preds}
+
+@router.post("/predict-ml/batch")
+def predict_ml_batch(body: MLBatchIn, user=Depends(get_current_user)):
+    # ✅ one vectorize + one scoring call for the whole batch
+    if len(body.symptom_sets) > settings.ML_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many symptom sets ({len(body.symptom_sets)}, max {settings.ML_BATCH_MAX})",
+        )
+    k = _clamp_k(body.top_k)
+    texts = [symptoms_to_text(s) for s in body.symptom_sets]
+
+    found = {}
+    generations = {}
+    for t in texts:
+        if t not in generations:
+            preds, generations[t] = prediction_cache.get(t, k)
+            if preds is not None:
+                found[t] = preds
+
+    # only sets not cached (each distinct one once) reach the model
+    missing = [t for t in generations if t not in found]
+    for t, preds in zip(missing, predict_top_batch(missing, k)):
+        found[t] = preds
+        prediction_cache.put(t, k, preds, generations[t])
+
+    return {"results": [{"predictions": found[t]} for t in texts]}
@@ -16,19 +16,129 @@ class Settings(BaseSettings):
     OPENROUTER_MODEL: str = "openai/gpt-4o-mini"
     OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
 
+    # ✅ OpenRouter HTTP pool (shared keep-alive client)
+    OPENROUTER_HTTP2: bool = True
+    OPENROUTER_MAX_CONNECTIONS: int = 20
+    OPENROUTER_MAX_KEEPALIVE: int = 10
+    OPENROUTER_KEEPALIVE_EXPIRY: float = 60.0
+    OPENROUTER_CONNECT_TIMEOUT: float = 5.0
+    OPENROUTER_READ_TIMEOUT: float = 60.0
+    OPENROUTER_WRITE_TIMEOUT: float = 10.0
+    OPENROUTER_POOL_TIMEOUT: float = 5.0
+
+    # ✅ Prompt size control (tokens; per-model override as JSON in .env)
+    PROMPT_TOKEN_BUDGET: int = 6000
+    PROMPT_TOKEN_BUDGETS: dict[str, int] = {}
+    PROMPT_CONTEXT_SHARE: float = 0.6       # share of the free budget for RAG chunks
+    CHAT_HISTORY_MAX_MESSAGES: int = 20     # newest messages considered for history
+
+    # ✅ Local medical-intent classifier (ml_assets/train_intent.py)
+    INTENT_MODEL_PATH: str = "ml_assets/intent_model.pkl"
+    INTENT_MEDICAL_THRESHOLD: float = 0.8   # P(medical) >= this -> medical
+    INTENT_OTHER_THRESHOLD: float = 0.15    # P(medical) <= this -> not medical
+    INTENT_LLM_ESCALATION: bool = True      # ask the LLM only in between
+
+    # ✅ Answer cache (exact + embedding-similarity, SQLite-backed)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_PATH: str = "answer_cache.db"
+    ANSWER_CACHE_MAX_ENTRIES: int = 2000
+    ANSWER_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    ANSWER_CACHE_SIMILARITY: float = 0.0    # 0 -> exact match only; >0 (e.g. 0.95) reuses answers for near-paraphrases
+
     # ✅ uploads
     UPLOAD_DIR: str = "uploads"
+    UPLOAD_MAX_BYTES: int = 25 * 1024 * 1024
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+    INGEST_WORKERS: int = 2        # parallel OCR/embedding jobs
+    INGEST_MAX_PENDING: int = 50   # queued + running; beyond -> 503
+    INGEST_CLAIM_SECONDS: int = 300  # an upload touched this recently belongs to a live worker
+    INGEST_SWEEP_SECONDS: int = 60   # renew own claims + re-queue stale uploads this often
+
+    # ✅ OCR engine (easyocr, loaded lazily, one per process)
+    OCR_LANGS: list[str] = ["en"]
+    OCR_GPU: bool = False
+    OCR_MAX_CONCURRENCY: int = 1       # OCR calls running at once in this process
+    OCR_THREADS: int = 0               # torch/OpenCV threads, 0 = library default
+    OCR_BATCH_SIZE: int = 4
+
+    # ✅ Image preprocessing before OCR (resize to a target text height, not a fixed 2x)
+    OCR_TARGET_TEXT_PX: int = 32       # text line height the recognizer sees
+    OCR_MAX_PIXELS: int = 4_000_000    # hard cap after scaling
+    OCR_MAX_UPSCALE: float = 3.0
+    OCR_CROP: bool = True              # crop to the region that contains ink
+    OCR_DESKEW: bool = False           # needs OpenCV
+
+    # ✅ PDF extraction (page-parallel; OCR only pages without a text layer)
+    PDF_WORKERS: int = 0               # text-layer process pool, 0 = one per CPU (max 4); OCR stays in-process
+    PDF_PARALLEL_MIN_PAGES: int = 8    # smaller PDFs are done in-process
+    PDF_PAGES_PER_TASK: int = 4
+    PDF_OCR_MIN_CHARS: int = 30        # page text shorter than this -> OCR that page
+    PDF_OCR_DPI: int = 200
     
-    # ✅ Vector backend switch: "pinecone" OR "faiss"
+    # ✅ Vector backend switch: "pinecone" OR "faiss" (local in-process store)
     VECTOR_BACKEND: str = "pinecone"
+    # ✅ Embeddings: "pinecone" (inference API) OR "local" (offline hashing, CI)
+    EMBED_BACKEND: str = "pinecone"
+
+    # ✅ Local vector store (VECTOR_BACKEND="faiss")
+    LOCAL_VECTOR_DIR: str = "vector_store"
+    LOCAL_VECTOR_DTYPE: str = "float32"     # or "float16" (half the disk/RAM)
+    LOCAL_VECTOR_IVF_MIN: int = 20000       # exact search below, IVF above
+    LOCAL_VECTOR_NPROBE: int = 16           # IVF lists scanned per query
 
     # ✅ Pinecone
     PINECONE_API_KEY: str = ""
     PINECONE_INDEX: str = "healthbot-rag-1024"
     PINECONE_EMBED_MODEL: str = "llama-text-embed-v2"
 
+    # ✅ Embedding cache (memory LRU + optional SQLite file; "" = memory only)
+    EMBED_CACHE_MAX_ENTRIES: int = 20000
+    EMBED_CACHE_PATH: str = "embed_cache.db"
+
+    # ✅ Retrieval: only chunks that actually match go into the prompt
+    RAG_TOP_K: int = 4
+    RAG_MIN_SCORE: float = 0.30        # global corpus (cosine)
+    RAG_MIN_SCORE_CHAT: float = 0.20   # the user's own uploads; doc questions use 0
+    RAG_CANDIDATES: int = 12           # fetched for MMR re-ranking
+    RAG_MMR_LAMBDA: float = 0.5        # relevance vs diversity, 1.0 = plain top-k
+    RAG_CHAT_WEIGHT: float = 1.2       # uploads outrank the global corpus at equal score
+    RAG_GLOBAL_WEIGHT: float = 1.0
+    RAG_CHAT_QUOTA: int = 4            # max chunks per namespace in the merged list
+    RAG_GLOBAL_QUOTA: int = 4
+    RAG_QUERY_CONCURRENCY: int = 8
+    DOC_REGISTRY_TTL_SECONDS: int = 30     # per-chat upload state cache (other workers' uploads)
+    DOC_REGISTRY_MAX_CHATS: int = 10000
+
+    # ✅ Chunking (sentence/section aware, ~token sized)
+    CHUNK_TARGET_TOKENS: int = 200
+    CHUNK_MAX_TOKENS: int = 400
+    CHUNK_OVERLAP_SENTENCES: int = 1
+    CHUNK_BOILERPLATE_MIN_REPEATS: int = 3   # pages a header/footer line must repeat on
+    CHUNK_DEDUP_THRESHOLD: float = 0.75      # MinHash Jaccard; 1.0 disables
+
+    # ✅ Ingest pipeline (embed + upsert run concurrently, batches sized to provider limits)
+    EMBED_CONCURRENCY: int = 4
+    UPSERT_CONCURRENCY: int = 4
+    EMBED_BATCH_MAX: int = 96          # Pinecone inference: max inputs per request
+    EMBED_BATCH_MAX_CHARS: int = 40000
+    UPSERT_MAX_VECTORS: int = 1000
+    UPSERT_MAX_BYTES: int = 1_800_000  # Pinecone: 2MB per upsert request
+    EMBED_MAX_RETRIES: int = 6         # on 429 / throttling, exponential backoff
+
+    # ✅ Symptom ML model artifacts (disease_model.pkl, vectorizer.pkl, label_encoder.pkl)
+    ML_MODEL_DIR: str = ""               # "" = backend/
+    ML_MMAP_MODE: str = "r"              # joblib mmap_mode; "" loads private copies
+    ML_RELOAD_CHECK_SECONDS: int = 30    # re-load when the files change; 0 = never
+    ML_LINEAR_SCORER: bool = True        # score with disease_linear.pkl when it is deployed
+    ML_BATCH_MAX: int = 1000             # symptom sets per /symptom/predict-ml/batch request
+    ML_MICROBATCH_WINDOW_MS: float = 3.0 # /symptom/predict-ml waits this long to batch concurrent calls; 0 = off
+    ML_MICROBATCH_MAX: int = 64          # ... or until this many are waiting
+    ML_PREDICTION_CACHE_SIZE: int = 10000  # cached (symptom set, top_k) results; 0 = off
+
     DATA_DIR: str = "data/medical_pdfs"
     PINECONE_NAMESPACE: str = "global-medical"
+    INGEST_MANIFEST_PATH: str = "ingest_manifest.db"  # what DATA_DIR ingest already indexed
+    INGEST_FILE_CONCURRENCY: int = 4  # DATA_DIR files indexed at once; their batches share the embed/upsert pools
 
 
 
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import settings
 
@@ -12,3 +12,18 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def ensure_columns(table: str, columns: dict):
+    """
+    create_all() never alters existing tables: add columns introduced after
+    the table was first created. columns = {name: "SQL TYPE [DEFAULT ...]"}.
+    """
+    insp = inspect(engine)
+    if not insp.has_table(table):
+        return
+    existing = {c["name"] for c in insp.get_columns(table)}
+    with engine.begin() as conn:
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
@@ -1,4 +1,7 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -9,18 +12,46 @@ from app.routes_chat import router as chat_router
 from app.api.diseases import router as diseases_router
 from app.api.symptom_checker import router as symptom_router
 
-from app.database import Base, engine
+from app.database import Base, engine, ensure_columns
 from app import models  # ✅ IMPORTANT: load models so tables register
 from app.api.quiz import router as quiz_router
 from app.api.reports import router as reports_router
 from app.api.feedback import router as feedback_router
+from app.services.http_client import openrouter_http
+from app.services.ingest_queue import ingest_queue
+from app.rag.pdf_utils import shutdown_pool as shutdown_pdf_pool
+from app.rag.upsert_pipeline import upsert_pipeline
+from app.services.prediction_batcher import prediction_batcher
 
 
 
 # ✅ Create DB tables (users, chats, messages, documents)
 Base.metadata.create_all(bind=engine)
+ensure_columns("documents", {
+    "status": "VARCHAR(20) DEFAULT 'ready'",  # rows from before the ingest queue were indexed inline
+    "error": "TEXT",
+    "chunks": "INTEGER DEFAULT 0",
+    "sha256": "VARCHAR(64)",
+    "claimed_at": "TIMESTAMP",
+})
+ensure_columns("chats", {
+    "title_pending_since": "TIMESTAMP",
+})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ✅ one pooled OpenRouter client for the whole process
+    openrouter_http.start()
+    ingest_queue.start()
+    yield
+    ingest_queue.shutdown()
+    shutdown_pdf_pool()
+    upsert_pipeline.shutdown()
+    await prediction_batcher.aclose()
+    await openrouter_http.aclose()
+
 
-app = FastAPI(title="AI Health Assistant API")
+app = FastAPI(title="AI Health Assistant API", lifespan=lifespan)
 
 # ✅ OPTIONAL: Disable ingest during development (faster startup)
 # from app.rag.ingest import ingest_folder_to_pinecone
@@ -28,6 +59,46 @@ app = FastAPI(title="AI Health Assistant API")
 # def startup_ingest():
 #     ingest_folder_to_pinecone()
 
+# ✅ Upload size limit, enforced while the body streams in: Starlette spools
+# the whole multipart body before the endpoint runs, so _store_upload's
+# check alone would come after the bytes were already on disk.
+class UploadSizeLimit:
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _too_large(self):
+        return HTTPException(
+            status_code=413,
+            detail=f"File too large (max {settings.UPLOAD_MAX_BYTES // (1024 * 1024)} MB)",
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].endswith("/upload"):
+            return await self.app(scope, receive, send)
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared and declared.isdigit() and int(declared) > self.max_bytes:
+            e = self._too_large()
+            return await JSONResponse({"detail": e.detail}, status_code=413)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise self._too_large()  # -> 413 from FastAPI's exception handler
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+# + 64KB for the multipart envelope; the file itself is checked exactly in _store_upload
+app.add_middleware(UploadSizeLimit, max_bytes=settings.UPLOAD_MAX_BYTES + 64 * 1024)
+
 # ✅ CORS
 app.add_middleware(
     CORSMiddleware,
@@ -57,6 +128,8 @@ app.include_router(feedback_router)
 #app.include_router(feedback_router)
 from app.api.ml_prediction import router as ml_router
 app.include_router(ml_router)
+from app.api.metrics import router as metrics_router
+app.include_router(metrics_router)
 
 
 @app.get("/")
@@ -25,6 +25,7 @@ class Chat(Base):
     user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
     title = Column(String(80), default="New Chat")
     share_id = Column(String(64), nullable=True)
+    title_pending_since = Column(DateTime, nullable=True)  # LLM title requested, not stored yet
 
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
@@ -55,6 +56,13 @@ class Document(Base):
 
     filename = Column(String(255))
     path = Column(String(500))
+    sha256 = Column(String(64), index=True, nullable=True)  # content address of the upload
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # ✅ background ingestion: queued | extracting | embedding | ready | failed
+    status = Column(String(20), default="queued")
+    error = Column(Text, nullable=True)
+    chunks = Column(Integer, default=0)
+    claimed_at = Column(DateTime, nullable=True)  # last touched by an ingest worker (see IngestQueue._claim)
+
     chat = relationship("Chat", back_populates="documents")
@@ -0,0 +1,271 @@
+# app/rag/chunker.py
+
+import hashlib
+import re
+from collections import Counter
+from typing import List
+
+import numpy as np
+
+from app.config import settings
+from app.services.prompt_builder import count_tokens
+
+
+# ---------------------------
+# Boilerplate (running headers / footers / page numbers)
+# ---------------------------
+def _line_key(line: str) -> str:
+    key = re.sub(r"\s+", " ", line.strip().lower())
+    # "Page 3 of 12" and "Page 4 of 12" are the same footer; any other
+    # number is content ("Hemoglobin 13.5 g/dL" on every page of a report)
+    if "page" in key:
+        key = re.sub(r"\d+", "#", key)
+    return key
+
+
+_PAGE_NUMBER_RE = re.compile(
+    r"[\s\-–]*\d{1,4}[\s\-–]*"                       # "12", "- 12 -"
+    r"|[\s\-–]*page\s*#(\s*(of|/)\s*#)?[\s\-–]*"    # "Page 3", "page 3 of 9", "Page 3/9"
+)
+
+
+_BARE_NUMBER_RE = re.compile(r"[\s\-–]*(\d{1,4})[\s\-–]*")
+
+_EDGE_LINES = 3
+
+
+def _is_page_number(key: str) -> bool:
+    # never "13.5", "120/80", "98.6": bare integers only, or lines saying "page"
+    return bool(_PAGE_NUMBER_RE.fullmatch(key))
+
+
+def _edge_lines(lines: List[str]) -> List[int]:
+    """Indices of the short lines among the first/last _EDGE_LINES non-empty lines of a page."""
+    filled = [i for i, l in enumerate(lines) if l.strip()]
+    edge = sorted(set(filled[:_EDGE_LINES] + filled[-_EDGE_LINES:]))
+    return [i for i in edge if len(lines[i].strip()) <= 120]
+
+
+def _page_number_offset(pages: List[List[str]], edges: List[List[int]], need: int):
+    """
+    n - page_index shared by a bare integer at an edge of >= need pages
+    (numbering may start anywhere), or None: a bare number is only a page
+    number when it counts the pages.
+    """
+    offsets = Counter()
+    for p, (lines, edge) in enumerate(zip(pages, edges)):
+        numbers = (_BARE_NUMBER_RE.fullmatch(lines[i]) for i in edge)
+        offsets.update({int(m.group(1)) - p for m in numbers if m})
+    if not offsets:
+        return None
+    offset, n = offsets.most_common(1)[0]
+    return offset if n >= need else None
+
+
+def strip_boilerplate(text: str) -> str:
+    r"""
+    Drops running headers/footers: short lines among the first/last
+    _EDGE_LINES of at least half of the pages (and of
+    CHUNK_BOILERPLATE_MIN_REPEATS of them), plus page numbers. Only those
+    edge positions are touched; the same text in a page body is content.
+    Pages are separated by form feeds (pdf_utils); text without pages only
+    loses "Page 3 of 9" style lines.
+
+    A lab report's table cells stay, its letterhead and numbering go:
+
+    >>> page = "City Diagnostics\n12 Main St\nReport: CBC\nTest\nResult\nPlatelets\n{}\nWBC\n7\nLDL\n110\nVerified: Dr. Rao\n{}"
+    >>> text = "\f".join(page.format(v, n) for n, v in enumerate([250, 180, 310], 1))
+    >>> strip_boilerplate(text).split("\f")[1].splitlines()
+    ['Test', 'Result', 'Platelets', '180', 'WBC', '7', 'LDL', '110']
+    >>> strip_boilerplate("BP\n120\n80")
+    'BP\n120\n80'
+    """
+    pages = [page.splitlines() for page in text.split("\f")]
+    edges = [_edge_lines(lines) for lines in pages]
+
+    repeated = set()
+    offset = None
+    if len(pages) >= settings.CHUNK_BOILERPLATE_MIN_REPEATS:
+        per_page = Counter()
+        for lines, edge in zip(pages, edges):
+            per_page.update({_line_key(lines[i]) for i in edge})
+        need = max(settings.CHUNK_BOILERPLATE_MIN_REPEATS, len(pages) // 2)
+        # a running header/footer has words; numbers go through the page count
+        repeated = {k for k, n in per_page.items() if n >= need and re.search(r"[^\W\d_]", k)}
+        offset = _page_number_offset(pages, edges, need)
+
+    def boilerplate(line: str, p: int) -> bool:
+        key = _line_key(line)
+        if key in repeated:
+            return True
+        if not _is_page_number(key):
+            return False
+        if "page" in key:
+            return True
+        # bare integer: only the one that counts the pages
+        m = _BARE_NUMBER_RE.fullmatch(line)
+        return bool(m) and offset is not None and int(m.group(1)) - p == offset
+
+    out = []
+    for p, (lines, edge) in enumerate(zip(pages, edges)):
+        drop = {i for i in edge if boilerplate(lines[i], p)}
+        out.append("\n".join(l for i, l in enumerate(lines) if i not in drop))
+    return "\f".join(out)
+
+
+# ---------------------------
+# Structural split: sections -> paragraphs -> sentences
+# ---------------------------
+_SENT_RE = re.compile(r"(?<=[.!?।॥])\s+")
+
+
+def _is_heading(para: str) -> bool:
+    p = para.strip()
+    if p.startswith("#"):
+        return True
+    return "\n" not in p and len(p) <= 80 and len(p.split()) <= 10 and not re.search(r"[.!?,;:]$", p)
+
+
+def _units(text: str) -> List[tuple[str, bool]]:
+    """(piece, starts_section) in document order; pieces are sentences or headings."""
+    out = []
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        if _is_heading(para):
+            out.append((para, True))
+            continue
+        flat = re.sub(r"\s*\n\s*", " ", para)
+        for sent in _SENT_RE.split(flat):
+            sent = sent.strip()
+            if sent:
+                out.append((sent, False))
+    return out
+
+
+def _split_long(sent: str, max_tokens: int) -> List[str]:
+    words = sent.split()
+    parts, cur = [], []
+    for w in words:
+        cur.append(w)
+        if count_tokens(" ".join(cur)) >= max_tokens:
+            parts.append(" ".join(cur))
+            cur = []
+    if cur:
+        parts.append(" ".join(cur))
+    return parts
+
+
+def _pack(units: List[tuple[str, bool]]) -> List[str]:
+    target = settings.CHUNK_TARGET_TOKENS
+    max_tokens = settings.CHUNK_MAX_TOKENS
+    overlap = settings.CHUNK_OVERLAP_SENTENCES
+
+    chunks: List[str] = []
+    cur: List[tuple[str, int]] = []  # (piece, tokens)
+    cur_tokens = 0
+
+    def flush(carry: bool):
+        nonlocal cur, cur_tokens
+        if cur:
+            chunks.append(" ".join(p for p, _ in cur).strip())
+        cur = cur[-overlap:] if (carry and overlap) else []
+        cur_tokens = sum(n for _, n in cur)
+
+    for piece, heading in units:
+        n = count_tokens(piece)
+        if n > max_tokens:
+            flush(carry=False)
+            for part in _split_long(piece, max_tokens):
+                chunks.append(part)
+            continue
+
+        # new section: don't glue its heading to the tail of the previous one
+        if heading and cur_tokens >= target // 2:
+            flush(carry=False)
+        elif cur_tokens + n > target and cur:
+            flush(carry=True)
+
+        cur.append((piece, n))
+        cur_tokens += n
+
+    flush(carry=False)
+
+    # a trailing sliver is worth more merged than on its own
+    if len(chunks) > 1 and count_tokens(chunks[-1]) < target // 4:
+        tail = chunks.pop()
+        if tail not in chunks[-1]:
+            chunks[-1] = f"{chunks[-1]} {tail}"
+    return chunks
+
+
+# ---------------------------
+# Near-duplicate suppression (MinHash + LSH banding)
+# ---------------------------
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(1234)
+_PERMS = 64
+_BANDS = 16
+_A = _rng.integers(1, _PRIME, size=_PERMS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, size=_PERMS, dtype=np.uint64)
+
+
+def _shingles(text: str, k: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= k:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + k]) for i in range(len(words) - k + 1)}
+
+
+def _minhash(shingles: set) -> np.ndarray:
+    hs = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=7).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+    # (a*h + b) mod p on 64-bit ints wraps; good enough for a hash family here
+    return ((np.outer(hs, _A) + _B) % _PRIME).min(axis=0)
+
+
+def dedup_chunks(chunks: List[str], threshold: float) -> List[str]:
+    """Keeps the first of any group of chunks whose estimated Jaccard similarity is >= threshold."""
+    if threshold >= 1.0 or len(chunks) < 2:
+        return chunks
+
+    rows = _PERMS // _BANDS
+    buckets: dict = {}
+    kept: List[str] = []
+    kept_sigs: List[np.ndarray] = []
+
+    for ch in chunks:
+        sig = _minhash(_shingles(ch))
+        bands = [(b, sig[b * rows : (b + 1) * rows].tobytes()) for b in range(_BANDS)]
+
+        candidates = set()
+        for band in bands:
+            candidates.update(buckets.get(band, ()))
+        if any(float(np.mean(kept_sigs[c] == sig)) >= threshold for c in candidates):
+            continue
+
+        idx = len(kept)
+        kept.append(ch)
+        kept_sigs.append(sig)
+        for band in bands:
+            buckets.setdefault(band, []).append(idx)
+    return kept
+
+
+# ---------------------------
+# Public
+# ---------------------------
+def chunk_text(text: str) -> List[str]:
+    """
+    Boilerplate-free, sentence-aligned chunks of ~CHUNK_TARGET_TOKENS tokens
+    (headings start a new chunk), with near-duplicates removed.
+    """
+    text = (text or "").strip()
+    if not text:
+        return []
+    text = strip_boilerplate(text)
+    chunks = _pack(_units(text))
+    return dedup_chunks(chunks, settings.CHUNK_DEDUP_THRESHOLD)
@@ -0,0 +1,140 @@
+# app/rag/embed_cache.py
+
+import hashlib
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from app.config import settings
+
+
+def _normalize(text: str) -> str:
+    # whitespace only: the embed models are case/punctuation sensitive
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+class EmbeddingCache:
+    """
+    LRU cache of embedding vectors keyed by (model, input_type, normalized text).
+
+    Memory first, then an optional SQLite file (float32 blobs) so passages and
+    frequent queries stay cached across restarts. Thread-safe: retrieval runs
+    in the thread pool.
+    """
+
+    def __init__(self, max_entries: int, path: str = ""):
+        self.max_entries = max_entries
+        self.path = path
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._db_ready = False
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(model: str, input_type: str, text: str) -> str:
+        raw = f"{model}|{input_type}|{_normalize(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ---------- sqlite ----------
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        conn = sqlite3.connect(self.path)
+        if not self._db_ready:
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB)")
+            conn.commit()
+            self._db_ready = True
+        return conn
+
+    def _disk_get(self, keys: List[str]) -> dict:
+        if not keys:
+            return {}
+        try:
+            conn = self._conn()
+            if conn is None:
+                return {}
+            found = {}
+            for i in range(0, len(keys), 500):  # sqlite variable limit
+                part = keys[i : i + 500]
+                marks = ",".join("?" * len(part))
+                for k, blob in conn.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part):
+                    found[k] = np.frombuffer(blob, dtype=np.float32).tolist()
+            conn.close()
+            return found
+        except sqlite3.Error as e:
+            print("Embedding cache read failed:", e)
+            return {}
+
+    def _disk_put(self, items: dict):
+        if not items:
+            return
+        try:
+            conn = self._conn()
+            if conn is None:
+                return
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items.items()],
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print("Embedding cache write failed:", e)
+
+    # ---------- memory ----------
+    def _remember(self, k: str, vec: List[float]):
+        self._mem[k] = vec
+        self._mem.move_to_end(k)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    # ---------- public ----------
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        out: List[Optional[List[float]]] = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for i, k in enumerate(keys):
+                v = self._mem.get(k)
+                if v is not None:
+                    self._mem.move_to_end(k)
+                    out[i] = v
+                    self._stats["hits"] += 1
+                else:
+                    missing.append(i)
+
+        if missing:
+            disk = self._disk_get(list({keys[i] for i in missing}))
+            with self._lock:
+                for i in missing:
+                    v = disk.get(keys[i])
+                    if v is not None:
+                        out[i] = v
+                        self._remember(keys[i], v)
+                        self._stats["disk_hits"] += 1
+                    else:
+                        self._stats["misses"] += 1
+        return out
+
+    def put_many(self, items: dict):
+        with self._lock:
+            for k, v in items.items():
+                self._remember(k, v)
+        self._disk_put(items)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["size"] = len(self._mem)
+        lookups = s["hits"] + s["disk_hits"] + s["misses"]
+        s["hit_rate"] = round((s["hits"] + s["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return s
+
+
+embed_cache = EmbeddingCache(
+    max_entries=settings.EMBED_CACHE_MAX_ENTRIES,
+    path=settings.EMBED_CACHE_PATH,
+)
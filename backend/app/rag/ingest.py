@@ -1,20 +1,150 @@
 # app/rag/ingest.py
 
+import hashlib
+import json
 import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from app.config import settings
-from app.rag.vectorstore import upsert_document_to_namespace
+from app.rag.vectorstore import (
+    read_file_text,
+    _chunk_text,
+    chunk_ids,
+    upsert_chunks_to_namespace,
+    delete_vectors,
+    clear_namespace,
+    is_local_backend,
+)
 
 # Allowed file types
 ALLOWED = {".pdf", ".txt", ".md"}
 
 
-def ingest_folder_to_pinecone():
+# ---------------------------
+# Manifest: what is already in the namespace
+# ---------------------------
+class IngestManifest:
     """
-    Reads DATA_DIR folder → chunks → embeddings → Pinecone namespace.
+    One row per (namespace, file): size, mtime, content hash and the ids of
+    the chunks upserted for it.
+
+    A file is marked "pending" (with its old and new chunk ids) before any
+    vector is written and "done" after, so a crashed run is simply redone:
+    upserts use deterministic ids and stale ids are still on record.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_manifest (
+                namespace TEXT,
+                path TEXT,
+                size INTEGER,
+                mtime REAL,
+                sha256 TEXT,
+                chunk_ids TEXT,
+                stale_ids TEXT,
+                status TEXT,
+                updated_at REAL,
+                PRIMARY KEY (namespace, path)
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def _conn(self):
+        return sqlite3.connect(self.path)
+
+    def rows(self, namespace: str) -> dict:
+        conn = self._conn()
+        cur = conn.execute(
+            "SELECT path, size, mtime, sha256, chunk_ids, stale_ids, status FROM ingest_manifest WHERE namespace = ?",
+            (namespace,),
+        )
+        out = {}
+        for path, size, mtime, sha, ids, stale, status in cur.fetchall():
+            out[path] = {
+                "size": size,
+                "mtime": mtime,
+                "sha256": sha,
+                "chunk_ids": json.loads(ids or "[]"),
+                "stale_ids": json.loads(stale or "[]"),
+                "status": status,
+            }
+        conn.close()
+        return out
+
+    def save(self, namespace: str, path: str, size: int, mtime: float, sha: str,
+             ids: list, stale: list, status: str):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO ingest_manifest "
+            "(namespace, path, size, mtime, sha256, chunk_ids, stale_ids, status, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (namespace, path, size, mtime, sha, json.dumps(ids), json.dumps(stale), status, time.time()),
+        )
+        conn.commit()
+        conn.close()
+
+    def remove(self, namespace: str, path: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM ingest_manifest WHERE namespace = ? AND path = ?", (namespace, path))
+        conn.commit()
+        conn.close()
+
+    def clear(self, namespace: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM ingest_manifest WHERE namespace = ?", (namespace,))
+        conn.commit()
+        conn.close()
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _index_file(manifest: IngestManifest, namespace: str, rel: str, path: str,
+                size: int, mtime: float, sha: str, prev: dict | None) -> int:
+    text = read_file_text(path)
+    chunks = _chunk_text(text)
+    ids = chunk_ids(rel, chunks)
+
+    stale = set(prev["stale_ids"]) if prev else set()
+    if prev:
+        stale |= set(prev["chunk_ids"])
+    stale -= set(ids)
+
+    # record intent first -> a crash from here on is redone next run
+    manifest.save(namespace, rel, size, mtime, sha, ids, sorted(stale), "pending")
+
+    upsert_chunks_to_namespace(namespace, os.path.basename(path), chunks, ids)
+    if stale:
+        delete_vectors(namespace, sorted(stale))
+
+    manifest.save(namespace, rel, size, mtime, sha, ids, [], "done")
+    return len(chunks)
+
+
+def ingest_folder_to_pinecone(rebuild: bool = False):
+    """
+    Reads DATA_DIR folder → chunks → embeddings → vector namespace
+    (Pinecone or the local store, per VECTOR_BACKEND).
+
+    Incremental: only new/changed files are embedded, vectors of changed or
+    deleted files are removed, and an interrupted run resumes where it
+    stopped. rebuild=True wipes the namespace + manifest first (also the way
+    to clear vectors left by older, random-id ingests).
     Safe version (no crash, clear logs).
     """
-    print("\n🚀 Starting Pinecone ingest...")
+    print(f"\n🚀 Starting {settings.VECTOR_BACKEND} ingest...")
+    started = time.perf_counter()
 
     folder = getattr(settings, "DATA_DIR", "")
     namespace = getattr(settings, "PINECONE_NAMESPACE", "global-medical")
@@ -28,40 +158,111 @@ def ingest_folder_to_pinecone():
         print(f"⚠️ Folder not found: {folder}")
         return
 
-    if getattr(settings, "VECTOR_BACKEND", "").lower() != "pinecone":
-        print("ℹ️ VECTOR_BACKEND not pinecone → skipping ingest")
+    backend = getattr(settings, "VECTOR_BACKEND", "").lower()
+    if backend != "pinecone" and not is_local_backend():
+        print(f"ℹ️ Unknown VECTOR_BACKEND '{backend}' → skipping ingest")
         return
 
-    if not getattr(settings, "PINECONE_API_KEY", ""):
+    needs_pinecone = backend == "pinecone" or settings.EMBED_BACKEND.lower() == "pinecone"
+    if needs_pinecone and not getattr(settings, "PINECONE_API_KEY", ""):
         print("⚠️ Pinecone API key missing")
         return
 
     print(f"📂 DATA_DIR = {folder}")
     print(f"📌 Namespace = {namespace}")
 
+    manifest = IngestManifest(settings.INGEST_MANIFEST_PATH)
+    if rebuild:
+        print("🧹 Rebuild: clearing namespace + manifest")
+        clear_namespace(namespace)
+        manifest.clear(namespace)
+
+    known = manifest.rows(namespace)
+    seen = set()
+
     count = 0
+    unchanged = 0
+    chunks = 0
     skipped = 0
+    failed = 0
 
-    # -------- Index files --------
+    # -------- Find new / changed files --------
+    todo = []
     for root, _, files in os.walk(folder):
-        for fn in files:
+        for fn in sorted(files):
             ext = os.path.splitext(fn)[1].lower()
             if ext not in ALLOWED:
                 skipped += 1
                 continue
 
             path = os.path.join(root, fn)
+            rel = os.path.relpath(path, folder).replace(os.sep, "/")
+            seen.add(rel)
+            prev = known.get(rel)
+
             try:
-                print(f"➡️ Processing: {fn}")
-                upsert_document_to_namespace(namespace=namespace, filepath=path)
+                st = os.stat(path)
+                if prev and prev["status"] == "done" and prev["size"] == st.st_size and prev["mtime"] == st.st_mtime:
+                    unchanged += 1
+                    continue
+
+                sha = _file_sha256(path)
+                if prev and prev["status"] == "done" and prev["sha256"] == sha:
+                    # touched, not changed
+                    manifest.save(namespace, rel, st.st_size, st.st_mtime, sha, prev["chunk_ids"], [], "done")
+                    unchanged += 1
+                    continue
+
+                todo.append((rel, path, st, sha, prev))
+            except Exception as e:
+                failed += 1
+                print(f"❌ Failed: {rel}")
+                print(" Error:", e)
+
+    # -------- Index them, several files at once --------
+    # each file's embed/upsert batches go to the shared upsert_pipeline
+    # pools, so small files no longer wait on each other's round trips
+    def index(rel, path, st, sha, prev):
+        print(f"➡️ Processing: {rel}" + (" (resuming)" if prev and prev["status"] == "pending" else ""))
+        return _index_file(manifest, namespace, rel, path, st.st_size, st.st_mtime, sha, prev)
+
+    workers = max(1, min(settings.INGEST_FILE_CONCURRENCY, len(todo)))
+    with ThreadPoolExecutor(workers, thread_name_prefix="ingest-file") as pool:
+        futures = {pool.submit(index, *job): job[0] for job in todo}
+        for fut in as_completed(futures):
+            rel = futures[fut]
+            try:
+                n = fut.result()
+                chunks += n
                 count += 1
-                print(f"✅ Indexed: {fn}")
+                print(f"✅ Indexed: {rel} ({n} chunks)")
             except Exception as e:
-                print(f"❌ Failed: {fn}")
+                failed += 1
+                print(f"❌ Failed: {rel}")
                 print(" Error:", e)
 
+    # -------- Remove vectors of deleted files --------
+    removed = 0
+    for rel, prev in known.items():
+        if rel in seen:
+            continue
+        try:
+            ids = prev["chunk_ids"] + prev["stale_ids"]
+            if ids:
+                delete_vectors(namespace, ids)
+            manifest.remove(namespace, rel)
+            removed += 1
+            print(f"🗑️ Removed: {rel}")
+        except Exception as e:
+            print(f"❌ Remove failed: {rel}")
+            print(" Error:", e)
+
     # -------- Final log --------
     print("\n🎉 Ingest complete")
-    print(f" Indexed files : {count}")
+    print(f" Indexed files : {count} ({chunks} chunks)")
+    print(f" Unchanged     : {unchanged}")
+    print(f" Removed files : {removed}")
+    print(f" Failed files  : {failed}")
     print(f" Skipped files : {skipped}")
     print(f" Namespace : {namespace}")
+    print(f" Took : {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,369 @@
+# app/rag/local_index.py
+
+import json
+import os
+import re
+import shutil
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# ---------------------------
+# One namespace on disk
+# ---------------------------
+class _Namespace:
+    """
+    Files in <root>/<namespace>/:
+      meta.json      {"dim": int, "dtype": "float32" | "float16"}
+      vectors.bin    append-only row-major matrix (unit-normalized rows), memory-mapped
+      rows.jsonl     append-only log: {"row", "id", "metadata"} | {"del": id}
+      ivf.npy        IVF centroids (only once the namespace is big enough)
+      ivf_assign.bin int32 centroid id per row (append-only, same length as vectors.bin)
+
+    An upsert of an existing id appends a new row and tombstones the old one;
+    compact() rewrites the files once too many rows are dead.
+    """
+
+    def __init__(self, path: str, dtype: str, ivf_min: int, nprobe: int):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.ivf_min = ivf_min
+        self.nprobe = nprobe
+        self.lock = threading.RLock()
+
+        self.dim: Optional[int] = None
+        self.n_rows = 0
+        self.id_to_row: Dict[str, int] = {}
+        self.row_ids: List[Optional[str]] = []
+        self.row_meta: List[Optional[dict]] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self._mm: Optional[np.ndarray] = None
+
+        self.centroids: Optional[np.ndarray] = None
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.ivf_trained_on = 0
+
+        self._load()
+
+    # ---------- files ----------
+    def _f(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        if not os.path.exists(self._f("meta.json")):
+            return
+        with open(self._f("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim = int(meta["dim"])
+        self.dtype = np.dtype(meta.get("dtype", self.dtype.name))
+        self.ivf_trained_on = int(meta.get("ivf_trained_on", 0))
+
+        row_bytes = self.dim * self.dtype.itemsize
+        file_rows = os.path.getsize(self._f("vectors.bin")) // row_bytes if os.path.exists(self._f("vectors.bin")) else 0
+
+        ids: List[Optional[str]] = [None] * file_rows
+        metas: List[Optional[dict]] = [None] * file_rows
+        id_to_row: Dict[str, int] = {}
+        if os.path.exists(self._f("rows.jsonl")):
+            with open(self._f("rows.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break  # torn last line after a crash
+                    if "del" in rec:
+                        id_to_row.pop(rec["del"], None)
+                        continue
+                    r = rec["row"]
+                    if r >= file_rows:
+                        break
+                    ids[r], metas[r] = rec["id"], rec.get("metadata") or {}
+                    id_to_row[rec["id"]] = r
+
+        self.n_rows = file_rows
+        self.row_ids, self.row_meta, self.id_to_row = ids, metas, id_to_row
+        self.alive = np.zeros(file_rows, dtype=bool)
+        if id_to_row:
+            self.alive[list(id_to_row.values())] = True
+        self._remap()
+
+        if os.path.exists(self._f("ivf.npy")) and os.path.exists(self._f("ivf_assign.bin")):
+            self.centroids = np.load(self._f("ivf.npy"))
+            assign = np.fromfile(self._f("ivf_assign.bin"), dtype=np.int32)
+            if len(assign) >= file_rows:
+                self.assign = assign[:file_rows]
+            else:
+                # rows appended without assignment (crash) -> assign them now
+                extra = self._nearest_centroid(np.asarray(self._mm[len(assign):], dtype=np.float32))
+                self.assign = np.concatenate([assign, extra])
+
+    def _write_meta(self):
+        tmp = self._f("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "ivf_trained_on": self.ivf_trained_on}, f)
+        os.replace(tmp, self._f("meta.json"))
+
+    def _remap(self):
+        if self.n_rows and self.dim:
+            self._mm = np.memmap(self._f("vectors.bin"), dtype=self.dtype, mode="r", shape=(self.n_rows, self.dim))
+        else:
+            self._mm = None
+
+    # ---------- IVF ----------
+    def _nearest_centroid(self, X: np.ndarray) -> np.ndarray:
+        if self.centroids is None or len(X) == 0:
+            return np.zeros(len(X), dtype=np.int32)
+        return np.argmax(X @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _rows_f32(self, rows: np.ndarray, block: int = 65536):
+        for i in range(0, len(rows), block):
+            part = rows[i : i + block]
+            yield part, np.asarray(self._mm[part], dtype=np.float32)
+
+    def _maybe_train_ivf(self):
+        n_alive = int(self.alive.sum())
+        if n_alive < self.ivf_min:
+            return
+        if self.centroids is not None and n_alive < 4 * self.ivf_trained_on:
+            return
+
+        # spherical k-means on a sample of live rows
+        rng = np.random.default_rng(0)
+        live = np.flatnonzero(self.alive)
+        nlist = int(min(4096, max(16, np.sqrt(n_alive))))
+        sample = np.sort(rng.choice(live, size=min(len(live), nlist * 64), replace=False))
+        X = np.asarray(self._mm[sample], dtype=np.float32)
+        C = X[rng.choice(len(X), size=nlist, replace=False)].copy()
+        for _ in range(12):
+            a = np.argmax(X @ C.T, axis=1)
+            for c in range(nlist):
+                members = X[a == c]
+                if len(members):
+                    v = members.sum(axis=0)
+                    n = np.linalg.norm(v)
+                    if n:
+                        C[c] = v / n
+        self.centroids = C
+
+        assign = np.zeros(self.n_rows, dtype=np.int32)
+        all_rows = np.arange(self.n_rows)
+        for part, block in self._rows_f32(all_rows):
+            assign[part] = self._nearest_centroid(block)
+        self.assign = assign
+        self.ivf_trained_on = n_alive
+
+        np.save(self._f("ivf.npy"), C)
+        assign.tofile(self._f("ivf_assign.bin"))
+        self._write_meta()
+
+    # ---------- writes ----------
+    def upsert(self, vectors: List[dict]):
+        if not vectors:
+            return
+        with self.lock:
+            X = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+            if self.dim is None:
+                self.dim = X.shape[1]
+                os.makedirs(self.path, exist_ok=True)
+                self._write_meta()
+            if X.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {X.shape[1]} does not match namespace dimension {self.dim}")
+
+            norms = np.linalg.norm(X, axis=1, keepdims=True)
+            X = X / np.where(norms == 0, 1, norms)
+
+            start = self.n_rows
+            with open(self._f("vectors.bin"), "ab") as f:
+                f.write(X.astype(self.dtype).tobytes())
+            if self.centroids is not None:
+                new_assign = self._nearest_centroid(X)
+                with open(self._f("ivf_assign.bin"), "ab") as f:
+                    f.write(new_assign.tobytes())
+                self.assign = np.concatenate([self.assign, new_assign])
+
+            with open(self._f("rows.jsonl"), "a", encoding="utf-8") as f:
+                for i, v in enumerate(vectors):
+                    f.write(json.dumps({"row": start + i, "id": v["id"], "metadata": v.get("metadata") or {}}) + "\n")
+
+            self.alive = np.concatenate([self.alive, np.ones(len(vectors), dtype=bool)])
+            for i, v in enumerate(vectors):
+                old = self.id_to_row.get(v["id"])
+                if old is not None:
+                    self.alive[old] = False
+                self.id_to_row[v["id"]] = start + i
+                self.row_ids.append(v["id"])
+                self.row_meta.append(v.get("metadata") or {})
+
+            self.n_rows += len(vectors)
+            self._remap()
+            self._maybe_compact()
+            self._maybe_train_ivf()
+
+    def delete(self, ids: List[str]):
+        with self.lock:
+            gone = [i for i in ids if i in self.id_to_row]
+            if not gone:
+                return
+            with open(self._f("rows.jsonl"), "a", encoding="utf-8") as f:
+                for i in gone:
+                    f.write(json.dumps({"del": i}) + "\n")
+                    self.alive[self.id_to_row.pop(i)] = False
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        dead = self.n_rows - int(self.alive.sum())
+        if dead < 1000 or dead < self.n_rows // 2:
+            return
+        self.compact()
+
+    def compact(self):
+        with self.lock:
+            live = np.flatnonzero(self.alive)
+            tmp = self.path + ".compact"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+
+            with open(os.path.join(tmp, "vectors.bin"), "wb") as f:
+                for _, block in self._rows_f32(live):
+                    f.write(block.astype(self.dtype).tobytes())
+            with open(os.path.join(tmp, "rows.jsonl"), "w", encoding="utf-8") as f:
+                for new_row, old_row in enumerate(live):
+                    f.write(json.dumps({"row": new_row, "id": self.row_ids[old_row], "metadata": self.row_meta[old_row]}) + "\n")
+            if self.centroids is not None:
+                np.save(os.path.join(tmp, "ivf.npy"), self.centroids)
+                self.assign[live].astype(np.int32).tofile(os.path.join(tmp, "ivf_assign.bin"))
+
+            self._mm = None
+            for name in ("vectors.bin", "rows.jsonl", "ivf.npy", "ivf_assign.bin"):
+                src = os.path.join(tmp, name)
+                if os.path.exists(src):
+                    os.replace(src, self._f(name))
+            shutil.rmtree(tmp, ignore_errors=True)
+            self._load()
+
+    # ---------- reads ----------
+    def query(self, vector: List[float], top_k: int, include_values: bool = False) -> List[dict]:
+        with self.lock:
+            if self._mm is None or not self.alive.any():
+                return []
+            q = np.asarray(vector, dtype=np.float32)
+            n = np.linalg.norm(q)
+            if n:
+                q = q / n
+
+            if self.centroids is not None:
+                probe = np.argsort(-(self.centroids @ q))[: self.nprobe]
+                candidates = np.flatnonzero(np.isin(self.assign, probe) & self.alive)
+            else:
+                candidates = np.flatnonzero(self.alive)
+
+            scores = np.empty(len(candidates), dtype=np.float32)
+            pos = 0
+            for part, block in self._rows_f32(candidates):
+                scores[pos : pos + len(part)] = block @ q
+                pos += len(part)
+
+            k = min(top_k, len(candidates))
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            out = []
+            for t in top:
+                r = int(candidates[t])
+                m = {"id": self.row_ids[r], "score": float(scores[t]), "metadata": self.row_meta[r]}
+                if include_values:
+                    m["values"] = np.asarray(self._mm[r], dtype=np.float32).tolist()
+                out.append(m)
+            return out
+
+    def fetch(self, ids: List[str]) -> Dict[str, dict]:
+        with self.lock:
+            out = {}
+            for i in ids:
+                r = self.id_to_row.get(i)
+                if r is not None:
+                    out[i] = {
+                        "id": i,
+                        "values": np.asarray(self._mm[r], dtype=np.float32).tolist(),
+                        "metadata": self.row_meta[r],
+                    }
+            return out
+
+    def count(self) -> int:
+        return int(self.alive.sum())
+
+
+# ---------------------------
+# Index (Pinecone-compatible surface)
+# ---------------------------
+class LocalIndex:
+    """
+    In-process vector index with the subset of the Pinecone Index API that
+    app.rag uses: upsert / query / delete / fetch / describe_index_stats.
+    Vectors are stored unit-normalized, so scores are cosine similarities.
+    Exact search below LOCAL_VECTOR_IVF_MIN live rows, IVF above it.
+    """
+
+    def __init__(self, root: str, dtype: str = "float32", ivf_min: int = 20000, nprobe: int = 16):
+        self.root = root
+        self.dtype = dtype
+        self.ivf_min = ivf_min
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._spaces: Dict[str, _Namespace] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, namespace: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", namespace or "__default__")
+        return os.path.join(self.root, safe)
+
+    def _ns(self, namespace: str) -> _Namespace:
+        with self._lock:
+            ns = self._spaces.get(namespace)
+            if ns is None:
+                ns = _Namespace(self._dir(namespace), self.dtype, self.ivf_min, self.nprobe)
+                self._spaces[namespace] = ns
+            return ns
+
+    def upsert(self, vectors: List[dict], namespace: str = ""):
+        self._ns(namespace).upsert(vectors)
+        return {"upserted_count": len(vectors)}
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        namespace: str = "",
+        include_metadata: bool = True,
+        include_values: bool = False,
+        **_,
+    ) -> dict:
+        matches = self._ns(namespace).query(vector, top_k, include_values=include_values)
+        if not include_metadata:
+            for m in matches:
+                m.pop("metadata", None)
+        return {"matches": matches, "namespace": namespace}
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = "", delete_all: bool = False, **_):
+        if delete_all:
+            with self._lock:
+                self._spaces.pop(namespace, None)
+                shutil.rmtree(self._dir(namespace), ignore_errors=True)
+            return {}
+        self._ns(namespace).delete(list(ids or []))
+        return {}
+
+    def fetch(self, ids: List[str], namespace: str = "") -> dict:
+        return {"vectors": self._ns(namespace).fetch(ids), "namespace": namespace}
+
+    def describe_index_stats(self) -> dict:
+        spaces = {}
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                if os.path.isdir(os.path.join(self.root, name)) and not name.endswith(".compact"):
+                    spaces[name] = {"vector_count": self._ns(name).count()}
+        return {"namespaces": spaces}
@@ -1,38 +1,148 @@
 # app/rag/pdf_utils.py
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
+
 import fitz  # PyMuPDF
+import numpy as np
+
+from app.config import settings
+
+# app.utils.ocr (easyocr / torch) is imported lazily in the parent only:
+# pool workers do text layers and must not load a model each.
+
+
+def _render(page, dpi: int) -> np.ndarray:
+    pix = page.get_pixmap(dpi=dpi)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+
+def _text_layer(path: str, pages: List[int]) -> List[Tuple[int, str]]:
+    """Embedded text per page (cheap; runs in pool workers)."""
+    doc = fitz.open(path)
+    try:
+        return [(i, (doc[i].get_text("text") or "").strip()) for i in pages]
+    finally:
+        doc.close()
+
+
+def _ocr_missing(
+    path: str, pages: List[Tuple[int, str]], min_chars: int, dpi: int, missed: Optional[list] = None
+) -> List[Tuple[int, str]]:
+    """
+    Pages without a usable text layer, OCR'd in one batch by the process's
+    shared engine. Pages that needed OCR but got none (engine missing or
+    failing) are appended to `missed`.
+    """
+    from app.utils.ocr import ocr_engine
+
+    scanned = [i for i, txt in pages if len(txt) < min_chars]
+    if not scanned:
+        return pages
+    if not ocr_engine.available:
+        if missed is not None:
+            missed.extend(scanned)
+        return pages
 
-def extract_text_from_pdf(path: str) -> str:
+    texts = dict(pages)
     doc = fitz.open(path)
-    out = []
+    try:
+        ocr = ocr_engine.recognize_batch([_render(doc[i], dpi) for i in scanned])
+        for i, txt in zip(scanned, ocr):
+            txt = txt.strip()
+            if len(txt) > len(texts[i]):
+                texts[i] = txt
+    except Exception as e:
+        # OCR optional: keep whatever the text layer had
+        print(f"OCR failed on {os.path.basename(path)} pages {[i + 1 for i in scanned]}:", e)
+        if missed is not None:
+            missed.extend(scanned)
+    finally:
+        doc.close()
+    return [(i, texts[i]) for i, _ in pages]
+
+
+# ---------------------------
+# Process pool: text layers only. OCR stays on the parent's single engine
+# (ocr_engine, OCR_MAX_CONCURRENCY): a pool worker per core each holding its
+# own easyocr/torch model would multiply OCR memory by the pool size.
+# ---------------------------
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
 
-    for page in doc:
-        txt = page.get_text("text") or ""
-        out.append(txt)
+def _worker_count() -> int:
+    n = settings.PDF_WORKERS or min(4, os.cpu_count() or 1)
+    return max(1, n)
 
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=_worker_count(),
+                mp_context=mp.get_context("spawn"),
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def shutdown_pool():
+    _reset_pool()
+
+
+# ---------------------------
+# Public
+# ---------------------------
+def iter_pdf_pages(path: str, missed: Optional[list] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_index, text) in page order as pages finish.
+    Text layers of large PDFs are read in PDF_PAGES_PER_TASK ranges across a
+    process pool; pages without one are OCR'd here, a range at a time.
+    Scanned pages OCR could not read are appended to `missed`.
+    """
+    doc = fitz.open(path)
+    n_pages = len(doc)
     doc.close()
-    text = "\n".join(out).strip()
-
-    # If text extracted is too small, run OCR
-    if len(text) < 80:
-        try:
-            import easyocr
-            import numpy as np
-
-            reader = easyocr.Reader(["en"])  # OCR English (best for PDFs)
-            doc = fitz.open(path)
-            ocr_out = []
-
-            for i in range(len(doc)):
-                page = doc[i]
-                pix = page.get_pixmap(dpi=200)
-                img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-                result = reader.readtext(img, detail=0)
-                ocr_out.append(" ".join(result))
-
-            doc.close()
-            text = "\n".join(ocr_out).strip()
-        except Exception as e:
-            # OCR optional: if error, just return whatever we got
-            return text
-
-    return text
+
+    min_chars = settings.PDF_OCR_MIN_CHARS
+    dpi = settings.PDF_OCR_DPI
+
+    step = max(1, settings.PDF_PAGES_PER_TASK)
+    ranges = [list(range(s, min(s + step, n_pages))) for s in range(0, n_pages, step)]
+
+    if n_pages < settings.PDF_PARALLEL_MIN_PAGES or _worker_count() == 1:
+        for r in ranges:
+            yield from _ocr_missing(path, _text_layer(path, r), min_chars, dpi, missed)
+        return
+
+    done = 0
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(_text_layer, path, r) for r in ranges]
+        for fut in futures:
+            pages = fut.result()
+            done += 1
+            yield from _ocr_missing(path, pages, min_chars, dpi, missed)
+    except BrokenProcessPool as e:
+        # a worker died (e.g. OOM on a huge page): finish the rest in-process
+        print("PDF worker pool broken, continuing serially:", e)
+        _reset_pool()
+        for r in ranges[done:]:
+            yield from _ocr_missing(path, _text_layer(path, r), min_chars, dpi, missed)
+
+
+def extract_text_from_pdf(path: str, missed: Optional[list] = None) -> str:
+    # form feed between pages: lets the chunker spot running headers/footers
+    return "\n\f\n".join(txt for _, txt in iter_pdf_pages(path, missed) if txt).strip()
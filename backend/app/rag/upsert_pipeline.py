@@ -0,0 +1,209 @@
+# app/rag/upsert_pipeline.py
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional
+
+from app.config import settings
+
+
+def _is_throttled(e: Exception) -> bool:
+    status = getattr(e, "status", None) or getattr(e, "status_code", None)
+    msg = str(e).lower()
+    return status == 429 or "429" in msg or "rate limit" in msg or "too many requests" in msg
+
+
+def _is_too_large(e: Exception) -> bool:
+    status = getattr(e, "status", None) or getattr(e, "status_code", None)
+    msg = str(e).lower()
+    return status == 413 or "too large" in msg or "request size" in msg
+
+
+class UpsertPipeline:
+    """
+    Embed -> upsert with bounded concurrency on both stages.
+
+    Chunks are grouped into embed batches by count and characters (provider
+    input limits), embedded on EMBED_CONCURRENCY threads, and as each batch
+    comes back its vectors are packed into upsert requests by payload size
+    and sent on UPSERT_CONCURRENCY threads. Throttling (429) backs off with
+    jitter; an oversized request is split in half and retried.
+
+    The thread pools are shared by every caller (chat uploads + DATA_DIR
+    ingest, several files at once), so the limits are per process, not per
+    document, and concurrent runs fill each other's round-trip gaps.
+    """
+
+    def __init__(self):
+        self._embed_pool: Optional[ThreadPoolExecutor] = None
+        self._upsert_pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "chunks": 0,
+            "embed_batches": 0,
+            "upsert_requests": 0,
+            "retries": 0,
+            "splits": 0,
+            "seconds": 0.0,  # wall clock with >= 1 run in flight (overlapping runs count once)
+            "last_chunks_per_sec": 0.0,
+        }
+        self._active = 0
+        self._busy_since = 0.0
+
+    def _pools(self):
+        with self._lock:
+            if self._embed_pool is None:
+                self._embed_pool = ThreadPoolExecutor(settings.EMBED_CONCURRENCY, thread_name_prefix="embed")
+                self._upsert_pool = ThreadPoolExecutor(settings.UPSERT_CONCURRENCY, thread_name_prefix="upsert")
+            return self._embed_pool, self._upsert_pool
+
+    def _count(self, **inc):
+        with self._lock:
+            for k, v in inc.items():
+                self._stats[k] += v
+
+    def _begin(self):
+        with self._lock:
+            if self._active == 0:
+                self._busy_since = time.perf_counter()
+            self._active += 1
+
+    def _end(self):
+        with self._lock:
+            self._active -= 1
+            if self._active == 0:
+                self._stats["seconds"] += time.perf_counter() - self._busy_since
+
+    # ---------- batching ----------
+    @staticmethod
+    def _embed_batches(texts: List[str]) -> List[List[int]]:
+        batches, cur, chars = [], [], 0
+        for i, t in enumerate(texts):
+            n = len(t)
+            if cur and (len(cur) >= settings.EMBED_BATCH_MAX or chars + n > settings.EMBED_BATCH_MAX_CHARS):
+                batches.append(cur)
+                cur, chars = [], 0
+            cur.append(i)
+            chars += n
+        if cur:
+            batches.append(cur)
+        return batches
+
+    @staticmethod
+    def _upsert_batches(vectors: List[dict]) -> List[List[dict]]:
+        batches, cur, size = [], [], 0
+        for v in vectors:
+            # float32 as JSON is ~10 bytes/value; metadata goes as-is
+            n = 10 * len(v["values"]) + len(json.dumps(v["metadata"], ensure_ascii=False)) + 64
+            if cur and (len(cur) >= settings.UPSERT_MAX_VECTORS or size + n > settings.UPSERT_MAX_BYTES):
+                batches.append(cur)
+                cur, size = [], 0
+            cur.append(v)
+            size += n
+        if cur:
+            batches.append(cur)
+        return batches
+
+    # ---------- retry / split ----------
+    def _call(self, fn: Callable, items: list, what: str):
+        """
+        fn(items) with backoff on throttling; halves `items` when the request
+        is too large. what: "embed" (returns vectors) or "upsert" (None).
+        """
+        delay = 0.5
+        for attempt in range(settings.EMBED_MAX_RETRIES + 1):
+            try:
+                return fn(items)
+            except Exception as e:
+                if _is_too_large(e) and len(items) > 1:
+                    self._count(splits=1)
+                    mid = len(items) // 2
+                    left = self._call(fn, items[:mid], what)
+                    right = self._call(fn, items[mid:], what)
+                    if what == "embed":
+                        return left + right  # vectors, in input order
+                    return None
+                if not _is_throttled(e) or attempt == settings.EMBED_MAX_RETRIES:
+                    raise
+                self._count(retries=1)
+                sleep = min(30.0, delay) * (0.5 + random.random())
+                print(f"⏳ {what} throttled, retrying in {sleep:.1f}s")
+                time.sleep(sleep)
+                delay *= 2
+
+    # ---------- public ----------
+    def run(
+        self,
+        namespace: str,
+        ids: List[str],
+        texts: List[str],
+        metadatas: List[dict],
+        embed: Callable[[List[str]], List[List[float]]],
+        upsert: Callable[[List[dict], str], None],
+    ) -> int:
+        if not texts:
+            return 0
+        started = time.perf_counter()
+        embed_pool, upsert_pool = self._pools()
+        self._begin()
+
+        pending = {}
+        try:
+            for batch in self._embed_batches(texts):
+                fut = embed_pool.submit(self._call, embed, [texts[i] for i in batch], "embed")
+                pending[fut] = ("embed", batch)
+                self._count(embed_batches=1)
+
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    kind, batch = pending.pop(fut)
+                    result = fut.result()  # first failure aborts the document
+                    if kind != "embed":
+                        continue
+                    vectors = [
+                        {"id": ids[i], "values": vec, "metadata": metadatas[i]}
+                        for i, vec in zip(batch, result)
+                    ]
+                    for part in self._upsert_batches(vectors):
+                        up = upsert_pool.submit(
+                            self._call, lambda vs: upsert(vs, namespace), part, "upsert"
+                        )
+                        pending[up] = ("upsert", None)
+                        self._count(upsert_requests=1)
+        except Exception:
+            for fut in pending:
+                fut.cancel()
+            raise
+        finally:
+            self._end()
+
+        took = time.perf_counter() - started
+        rate = len(texts) / took if took > 0 else 0.0
+        self._count(chunks=len(texts))
+        with self._lock:
+            self._stats["last_chunks_per_sec"] = round(rate, 1)
+        print(f"📤 {namespace}: {len(texts)} chunks in {took:.2f}s ({rate:.1f} chunks/s)")
+        return len(texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            if self._active:
+                s["seconds"] += time.perf_counter() - self._busy_since
+        s["seconds"] = round(s["seconds"], 2)
+        s["chunks_per_sec"] = round(s["chunks"] / s["seconds"], 1) if s["seconds"] else 0.0
+        return s
+
+    def shutdown(self):
+        with self._lock:
+            for pool in (self._embed_pool, self._upsert_pool):
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            self._embed_pool = self._upsert_pool = None
+
+
+upsert_pipeline = UpsertPipeline()
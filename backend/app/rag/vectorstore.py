@@ -1,54 +1,129 @@
 # app/rag/vectorstore.py
 
 import os
+import re
 import uuid
-from typing import List, Optional
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
-from pinecone import Pinecone
+import numpy as np
 
 from app.config import settings
+from app.rag.embed_cache import embed_cache
+from app.rag.upsert_pipeline import upsert_pipeline
+from app.rag.chunker import chunk_text
 
 # ---------------------------
-# Pinecone clients
+# Vector backend (VECTOR_BACKEND: "pinecone" | "faiss"/"local")
 # ---------------------------
-pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-index = pc.Index(settings.PINECONE_INDEX)
+LOCAL_BACKENDS = {"faiss", "local"}
+_pc = None
+
+
+def _pinecone():
+    """Pinecone client, created on first use (local backend may never need it)."""
+    global _pc
+    if _pc is None:
+        from pinecone import Pinecone
+        _pc = Pinecone(api_key=settings.PINECONE_API_KEY)
+    return _pc
+
+
+def is_local_backend() -> bool:
+    return settings.VECTOR_BACKEND.lower() in LOCAL_BACKENDS
+
+
+def _make_index():
+    if is_local_backend():
+        from app.rag.local_index import LocalIndex
+        return LocalIndex(
+            root=settings.LOCAL_VECTOR_DIR,
+            dtype=settings.LOCAL_VECTOR_DTYPE,
+            ivf_min=settings.LOCAL_VECTOR_IVF_MIN,
+            nprobe=settings.LOCAL_VECTOR_NPROBE,
+        )
+    return _pinecone().Index(settings.PINECONE_INDEX)
+
+
+# same upsert/query/delete/fetch surface for both backends
+index = _make_index()
 
 # IMPORTANT:
 # Your Pinecone index is 384-dim (as you printed).
 # So embed model MUST also output 384 dims.
 # Your index embed model is: llama-text-embed-v2 (384)
-EMBED_MODEL = getattr(settings, "PINECONE_EMBED_MODEL", "llama-text-embed-v2")
+# EMBED_BACKEND="local" -> offline hashing embeddings (local vector backend / CI only)
+EMBED_MODEL = (
+    "local-hash" if settings.EMBED_BACKEND.lower() == "local"
+    else getattr(settings, "PINECONE_EMBED_MODEL", "llama-text-embed-v2")
+)
+LOCAL_EMBED_DIM = 1024
+
+
+def _local_embed(texts: List[str]) -> List[List[float]]:
+    """
+    Deterministic feature-hashing embedding (word unigrams + bigrams).
+    No network and no model download; lexical, not semantic, so meant for
+    offline runs and CI rather than production retrieval.
+    """
+    out = []
+    for t in texts:
+        v = np.zeros(LOCAL_EMBED_DIM, dtype=np.float32)
+        words = re.findall(r"\w+", (t or "").lower())
+        grams = words + [a + " " + b for a, b in zip(words, words[1:])]
+        for g in grams:
+            h = int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little")
+            v[h % LOCAL_EMBED_DIM] += 1.0 if (h >> 63) else -1.0
+        n = np.linalg.norm(v)
+        out.append((v / n if n else v).tolist())
+    return out
 
 
 def _embed_texts(texts: List[str], *, input_type: str) -> List[List[float]]:
     """
-    Pinecone Inference embeddings (NO local model)
+    Pinecone Inference embeddings (or local hashing when EMBED_BACKEND="local")
     input_type: "passage" for docs, "query" for question
+    Cached (embed_cache): only texts never seen before go over the network.
     """
-    res = pc.inference.embed(
-        model=EMBED_MODEL,
-        inputs=texts,
-        parameters={"input_type": input_type, "truncate": "END"},
-    )
-    return [x["values"] for x in res.data]
+    keys = [embed_cache.key(EMBED_MODEL, input_type, t) for t in texts]
+    out = embed_cache.get_many(keys)
+
+    todo: dict = {}  # key -> text (dedup within the batch)
+    for k, t, v in zip(keys, texts, out):
+        if v is None:
+            todo.setdefault(k, t)
+
+    if todo:
+        if EMBED_MODEL == "local-hash":
+            vecs = _local_embed(list(todo.values()))
+        else:
+            res = _pinecone().inference.embed(
+                model=EMBED_MODEL,
+                inputs=list(todo.values()),
+                parameters={"input_type": input_type, "truncate": "END"},
+            )
+            vecs = [x["values"] for x in res.data]
+        fresh = dict(zip(todo.keys(), vecs))
+        embed_cache.put_many(fresh)
+        out = [v if v is not None else fresh[k] for k, v in zip(keys, out)]
+
+    return out
 
 
 def _embed_query(q: str) -> List[float]:
     return _embed_texts([q], input_type="query")[0]
 
 
-def _chunk_text(text: str, max_chars: int = 800, overlap: int = 120) -> List[str]:
-    text = (text or "").strip()
-    if not text:
-        return []
+def _chunk_text(text: str) -> List[str]:
+    # sentence/section aligned, boilerplate stripped, near-duplicates dropped
+    return chunk_text(text)
 
-    chunks: List[str] = []
-    i = 0
-    while i < len(text):
-        chunks.append(text[i : i + max_chars])
-        i += max_chars - overlap
-    return chunks
+
+def read_file_text(filepath: str) -> str:
+    """Text of a .txt/.md/.pdf file (PDF: text layer, OCR fallback)."""
+    return _read_file(filepath)
 
 
 def _read_file(filepath: str) -> str:
@@ -65,49 +140,61 @@ def _read_file(filepath: str) -> str:
     return ""
 
 
+def chunk_ids(source_key: str, chunks: List[str]) -> List[str]:
+    """Deterministic ids (source + position + content): re-ingesting the same file overwrites, never duplicates."""
+    return [
+        hashlib.sha256(f"{source_key}\n{i}\n{c}".encode("utf-8")).hexdigest()[:32]
+        for i, c in enumerate(chunks)
+    ]
+
+
 def _upsert_chunks(
     namespace: str,
     source_name: str,
     chat_id: Optional[int],
     chunks: List[str],
-):
+    ids: Optional[List[str]] = None,
+) -> int:
     if not chunks:
-        return
-
-    BATCH = 12  # keep requests small
-    for i in range(0, len(chunks), BATCH):
-        part = chunks[i : i + BATCH]
-        vectors = _embed_texts(part, input_type="passage")
-
-        to_upsert = []
-        for chunk, vec in zip(part, vectors):
-            vid = str(uuid.uuid4())
-            md = {
-                "source": source_name,
-                "text": chunk,
-            }
-            if chat_id is not None:
-                md["chat_id"] = chat_id
-
-            to_upsert.append({"id": vid, "values": vec, "metadata": md})
-
+        return 0
+
+    if not ids:
+        ids = [str(uuid.uuid4()) for _ in chunks]
+
+    metadatas = []
+    for chunk in chunks:
+        md = {
+            "source": source_name,
+            "text": chunk,
+        }
+        if chat_id is not None:
+            md["chat_id"] = chat_id
+        metadatas.append(md)
+
+    # ✅ concurrent embed + upsert, batches sized to provider limits
+    return upsert_pipeline.run(
+        namespace=namespace,
+        ids=ids,
+        texts=chunks,
+        metadatas=metadatas,
+        embed=lambda part: _embed_texts(part, input_type="passage"),
         # ✅ Classic upsert supports metadata dict
-        index.upsert(vectors=to_upsert, namespace=namespace)
+        upsert=lambda vectors, ns: index.upsert(vectors=vectors, namespace=ns),
+    )
 
 
 # ---------------------------
 # CHAT UPLOAD -> chat-{chat_id}
 # ---------------------------
-def upsert_document_to_chat(chat_id: int, filepath: str):
-    namespace = f"chat-{chat_id}"
-    text = _read_file(filepath)
-    if not text.strip():
-        return
+def upsert_text_to_chat(chat_id: int, text: str, source_name: str) -> int:
+    """Chunks + embeds already-extracted text into chat-{chat_id}. Returns chunk count."""
+    if not (text or "").strip():
+        return 0
 
     chunks = _chunk_text(text)
-    _upsert_chunks(
-        namespace=namespace,
-        source_name=os.path.basename(filepath),
+    return _upsert_chunks(
+        namespace=f"chat-{chat_id}",
+        source_name=source_name,
         chat_id=chat_id,
         chunks=chunks,
     )
@@ -116,58 +203,145 @@ def upsert_document_to_chat(chat_id: int, filepath: str):
 # ---------------------------
 # GLOBAL DATASET -> namespace (global-medical)
 # ---------------------------
-def upsert_document_to_namespace(namespace: str, filepath: str):
-    text = _read_file(filepath)
-    if not text.strip():
-        return
+def upsert_chunks_to_namespace(namespace: str, source_name: str, chunks: List[str], ids: List[str]) -> int:
+    return _upsert_chunks(namespace=namespace, source_name=source_name, chat_id=None, chunks=chunks, ids=ids)
 
-    chunks = _chunk_text(text)
-    _upsert_chunks(
-        namespace=namespace,
-        source_name=os.path.basename(filepath),
-        chat_id=None,
-        chunks=chunks,
-    )
 
+def delete_vectors(namespace: str, ids: List[str]):
+    for i in range(0, len(ids), 1000):  # Pinecone delete limit
+        index.delete(ids=ids[i : i + 1000], namespace=namespace)
+
+
+def clear_namespace(namespace: str):
+    try:
+        index.delete(delete_all=True, namespace=namespace)
+    except Exception as e:
+        # Pinecone 404s on a namespace that doesn't exist yet
+        print(f"Namespace {namespace} not cleared:", e)
 
-def retrieve_context_for_chat(chat_id: int, query: str, top_k: int = 4) -> str:
-    namespace = f"chat-{chat_id}"
-    qvec = _embed_query(query)
 
+# ---------------------------
+# Scored retrieval: threshold + MMR
+# ---------------------------
+def _query_matches(namespace: str, qvec: List[float], top_k: int, with_values: bool = False) -> List[dict]:
     res = index.query(
         namespace=namespace,
         vector=qvec,
         top_k=top_k,
         include_metadata=True,
+        include_values=with_values,
     )
-
-    matches = (res.get("matches") or [])
-    texts: List[str] = []
-    for m in matches:
+    out = []
+    for m in (res.get("matches") or []):
         md = (m.get("metadata") or {})
         t = md.get("text")
-        if t:
-            texts.append(t)
-
-    return "\n\n".join(texts).strip()
-
+        if not t:
+            continue
+        out.append({
+            "id": m.get("id"),
+            "text": t,
+            "score": float(m.get("score") or 0.0),
+            "source": md.get("source"),
+            "namespace": namespace,
+            "values": m.get("values") if with_values else None,
+        })
+    return out
+
+
+def _mmr(matches: List[dict], qvec: List[float], k: int, lam: float) -> List[dict]:
+    """Maximal marginal relevance: relevance minus redundancy with chunks already picked."""
+    if len(matches) <= 1 or any(not m.get("values") for m in matches):
+        return matches[:k]
+
+    vecs = np.asarray([m["values"] for m in matches], dtype=np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+    q = np.asarray(qvec, dtype=np.float32)
+    rel = vecs @ (q / (np.linalg.norm(q) + 1e-12))
+
+    picked: List[int] = []
+    rest = list(range(len(matches)))
+    while rest and len(picked) < k:
+        if picked:
+            redundancy = (vecs[rest] @ vecs[picked].T).max(axis=1)
+        else:
+            redundancy = np.zeros(len(rest), dtype=np.float32)
+        best = rest[int(np.argmax(lam * rel[rest] - (1 - lam) * redundancy))]
+        picked.append(best)
+        rest.remove(best)
+    return [matches[i] for i in picked]
+
+
+def search_namespace(namespace: str, qvec: List[float], top_k: int, min_score: float) -> List[dict]:
+    """
+    Scored matches ({"text", "score", "source", "namespace", ...}) above
+    min_score, de-duplicated with MMR, best first. An empty list means the
+    namespace has nothing relevant, not "use the top-k anyway".
+    """
+    use_mmr = settings.RAG_MMR_LAMBDA < 1.0
+    fetch_k = max(top_k, settings.RAG_CANDIDATES) if use_mmr else top_k
+    matches = [m for m in _query_matches(namespace, qvec, fetch_k, with_values=use_mmr) if m["score"] >= min_score]
+    if use_mmr:
+        matches = _mmr(matches, qvec, top_k, settings.RAG_MMR_LAMBDA)
+    for m in matches:
+        m.pop("values", None)
+    return matches[:top_k]
 
-def retrieve_context_from_namespace(namespace: str, query: str, top_k: int = 4) -> str:
-    qvec = _embed_query(query)
 
-    res = index.query(
-        namespace=namespace,
-        vector=qvec,
-        top_k=top_k,
-        include_metadata=True,
-    )
+_query_pool = ThreadPoolExecutor(max_workers=settings.RAG_QUERY_CONCURRENCY, thread_name_prefix="rag")
 
-    matches = (res.get("matches") or [])
-    texts: List[str] = []
-    for m in matches:
-        md = (m.get("metadata") or {})
-        t = md.get("text")
-        if t:
-            texts.append(t)
 
-    return "\n\n".join(texts).strip()
+def retrieve_multi(
+    query: str,
+    sources: List[dict],
+    top_k: int = 4,
+    cancelled: Optional[threading.Event] = None,
+) -> Tuple[List[dict], List[float]]:
+    """
+    One query embedding, all namespaces queried concurrently, results merged.
+
+    sources: [{"namespace", "weight", "min_score", "quota"}]; min_score is
+    checked on the raw cosine score, ranking uses score * weight, and at most
+    `quota` chunks come from one namespace. Same text from two namespaces is
+    kept once. Returns (matches best first, query_vector); blocking, so async
+    callers run it in a thread. Setting `cancelled` before the queries go out
+    skips them.
+    """
+    qvec = _embed_query(query)
+    if not sources or (cancelled is not None and cancelled.is_set()):
+        return [], qvec
+
+    futures = [
+        _query_pool.submit(search_namespace, src["namespace"], qvec, src.get("quota") or top_k, src.get("min_score", 0.0))
+        for src in sources
+    ]
+
+    merged = []
+    for src, fut in zip(sources, futures):
+        try:
+            found = fut.result()
+        except Exception as e:
+            # one missing/broken namespace shouldn't sink the others
+            print(f"⚠️ rag query failed for {src['namespace']}:", e)
+            continue
+        weight = float(src.get("weight", 1.0))
+        for m in found:
+            m["weighted"] = m["score"] * weight
+            merged.append(m)
+
+    merged.sort(key=lambda m: -m["weighted"])
+    out, seen = [], set()
+    for m in merged:
+        key = re.sub(r"\s+", " ", m["text"]).strip()
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append(m)
+        if len(out) >= top_k:
+            break
+
+    if out:
+        picked = ", ".join(f"{m['namespace']}:{m['score']:.2f}" for m in out)
+        print(f"🔎 rag {len(out)} chunks ({picked})")
+    else:
+        print(f"🔎 rag: nothing above threshold in {', '.join(s['namespace'] for s in sources)} -> general answer")
+    return out, qvec
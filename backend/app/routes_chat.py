@@ -1,13 +1,20 @@
 # app/routes_chat.py
 
 import os
+import json
 import uuid
-from datetime import datetime
+import hashlib
+import asyncio
+import threading
+from datetime import datetime, timedelta
 
+import httpx
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.auth import get_current_user
 from app.models import User, Chat, Message, Document
 from app.schemas import (
@@ -16,19 +23,26 @@ from app.schemas import (
     ChatRenameIn,
     ChatSendIn,
     ChatSendOut,
+    ChatTitleOut,
+    DocumentOut,
     MessageOut,
 )
 
 from app.services.openrouter_client import (
     openrouter_chat,
+    openrouter_chat_stream,
     is_medical_query_openrouter,
     generate_chat_title,
+    quick_chat_title,
 )
 
+from app.services.intent_classifier import is_doc_question
+from app.services.answer_cache import answer_cache
+from app.services.ingest_queue import ingest_queue
+from app.services.retrieval_planner import plan_retrieval, doc_registry
+
 from app.rag.vectorstore import (
-    upsert_document_to_chat,
-    retrieve_context_for_chat,
-    retrieve_context_from_namespace,
+    retrieve_multi,
 )
 
 from app.config import settings
@@ -37,26 +51,6 @@ router = APIRouter(prefix="/chat", tags=["Chat"])
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
 
-# -----------------------
-# helper: detect doc-related question
-# -----------------------
-def is_doc_question(t: str) -> bool:
-    t = (t or "").lower()
-    doc_words = [
-        "this pdf", "in this pdf", "from this pdf",
-        "this file", "in this file", "from this file",
-        "this document", "in this document", "from this document",
-        "this image", "in this image", "from this image",
-        "this photo", "in this photo", "from this photo",
-        "uploaded file", "uploaded", "upload", "attachment",
-        "above image", "given image",
-        "extract", "summarize", "summary", "explain this",
-        "what is written", "what does it say",
-        "medicine name", "tablet name", "drug name",
-    ]
-    return any(w in t for w in doc_words)
-
-
 # -----------------------
 # Create New Chat
 # -----------------------
@@ -127,6 +121,18 @@ def get_messages(chat_id: int, db: Session = Depends(get_db), user: User = Depen
     ]
 
 
+# -----------------------
+# Chat Title (poll while the LLM title is pending)
+# -----------------------
+@router.get("/{chat_id}/title", response_model=ChatTitleOut)
+def get_chat_title(chat_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    chat = db.query(Chat).filter(Chat.id == chat_id, Chat.user_id == user.id).first()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    return {"title": chat.title, "pending": _title_is_pending(chat)}
+
+
 # -----------------------
 # Rename Chat
 # -----------------------
@@ -153,6 +159,7 @@ def delete_chat(chat_id: int, db: Session = Depends(get_db), user: User = Depend
 
     db.delete(chat)
     db.commit()
+    doc_registry.invalidate(chat_id)
     return {"ok": True}
 
 
@@ -172,6 +179,58 @@ def share_chat(chat_id: int, db: Session = Depends(get_db), user: User = Depends
     return {"share_id": chat.share_id}
 
 
+# -----------------------
+# Upload storage (content-addressed: UPLOAD_DIR/objects/ab/abcdef....ext)
+# -----------------------
+def _place_upload(tmp_path: str, sha256: str, ext: str) -> str:
+    obj_dir = os.path.join(settings.UPLOAD_DIR, "objects", sha256[:2])
+    os.makedirs(obj_dir, exist_ok=True)
+    final_path = os.path.join(obj_dir, f"{sha256}{ext}")
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, final_path)
+    return final_path
+
+
+def _discard_upload(f, tmp_path: str):
+    f.close()
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+async def _store_upload(file: UploadFile, ext: str) -> tuple[str, str]:
+    # disk I/O on the threadpool: a slow disk must not stall the event loop
+    tmp_dir = os.path.join(settings.UPLOAD_DIR, "tmp")
+    await run_in_threadpool(os.makedirs, tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+
+    h = hashlib.sha256()
+    size = 0
+    f = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(settings.UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > settings.UPLOAD_MAX_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File too large (max {settings.UPLOAD_MAX_BYTES // (1024 * 1024)} MB)",
+                )
+            h.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+        await run_in_threadpool(f.close)
+
+        sha256 = h.hexdigest()
+        final_path = await run_in_threadpool(_place_upload, tmp_path, sha256, ext)
+        return sha256, final_path
+    except BaseException:
+        await run_in_threadpool(_discard_upload, f, tmp_path)
+        raise
+
+
 # -----------------------
 # Upload File to Chat
 # -----------------------
@@ -190,64 +249,96 @@ async def upload_file(
     if ext not in [".pdf", ".txt", ".md", ".png", ".jpg", ".jpeg"]:
         raise HTTPException(status_code=400, detail="Only pdf/txt/md/png/jpg allowed")
 
-    safe_name = f"{chat_id}_{uuid.uuid4().hex}{ext}"
-    save_path = os.path.join(settings.UPLOAD_DIR, safe_name)
+    # ✅ stream to disk in chunks (bounded memory), hash + size-limit on the fly
+    sha256, save_path = await _store_upload(file, ext)
 
-    content = await file.read()
-    with open(save_path, "wb") as f:
-        f.write(content)
+    # ✅ same file already in this chat -> nothing to do
+    existing = (
+        db.query(Document)
+        .filter(Document.chat_id == chat_id, Document.sha256 == sha256, Document.status != "failed")
+        .first()
+    )
+    if existing:
+        return {
+            "ok": True,
+            "filename": file.filename,
+            "document_id": existing.id,
+            "status": existing.status,
+            "duplicate": True,
+        }
 
     doc = Document(
         chat_id=chat_id,
         filename=file.filename,
         path=save_path,
+        sha256=sha256,
         created_at=datetime.utcnow(),
+        status="queued",
+        claimed_at=datetime.utcnow(),
     )
     db.add(doc)
+    chat.updated_at = datetime.utcnow()
     db.commit()
+    db.refresh(doc)
+    doc_registry.invalidate(chat_id)
 
-    # ✅ index into chat namespace
-    # If image -> OCR -> create .txt -> upsert txt for RAG
-    # ✅ index into chat namespace
-    if ext in [".png", ".jpg", ".jpeg"]:
-        try:
-            from app.utils.ocr import extract_text_from_image
-            ocr_text = extract_text_from_image(save_path)
+    # ✅ OCR / PDF extraction + embedding happen in the ingest worker pool
+    if not ingest_queue.submit(doc.id):
+        doc.status = "failed"
+        doc.error = "Ingestion queue is full"
+        db.commit()
+        raise HTTPException(status_code=503, detail="Too many uploads in progress, please retry shortly")
 
-            txt_path = save_path + ".txt"
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write(ocr_text or "")
+    return {"ok": True, "filename": file.filename, "document_id": doc.id, "status": doc.status}
 
-            # ✅ IMPORTANT: always upsert TXT only
-            upsert_document_to_chat(chat_id=chat_id, filepath=txt_path)
 
-        except Exception:
-            # if OCR fails still create txt and upsert empty
-            txt_path = save_path + ".txt"
-            with open(txt_path, "w", encoding="utf-8") as f:
-                f.write("")
-            upsert_document_to_chat(chat_id=chat_id, filepath=txt_path)
+def _doc_out(d: Document) -> dict:
+    return {
+        "id": d.id,
+        "filename": d.filename,
+        "status": d.status or "ready",
+        "chunks": d.chunks or 0,
+        "error": d.error,
+        "created_at": d.created_at.isoformat(),
+    }
 
-    else:
-        upsert_document_to_chat(chat_id=chat_id, filepath=save_path)
 
+# -----------------------
+# Uploaded Documents (ingestion status)
+# -----------------------
+@router.get("/{chat_id}/documents", response_model=list[DocumentOut])
+def list_documents(chat_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    chat = db.query(Chat).filter(Chat.id == chat_id, Chat.user_id == user.id).first()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    docs = db.query(Document).filter(Document.chat_id == chat_id).order_by(Document.created_at.asc()).all()
+    return [_doc_out(d) for d in docs]
 
-    chat.updated_at = datetime.utcnow()
-    db.commit()
 
-    return {"ok": True, "filename": file.filename}
+@router.get("/{chat_id}/documents/{doc_id}", response_model=DocumentOut)
+def get_document(chat_id: int, doc_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    chat = db.query(Chat).filter(Chat.id == chat_id, Chat.user_id == user.id).first()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    doc = db.query(Document).filter(Document.id == doc_id, Document.chat_id == chat_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return _doc_out(doc)
 
 
 # -----------------------
-# Send Message (Classifier + RAG + Fallback)
+# Send Message helpers (shared by /send and /send/stream)
 # -----------------------
-@router.post("/{chat_id}/send", response_model=ChatSendOut)
-async def send_message(
-    chat_id: int,
-    body: ChatSendIn,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
+NON_MEDICAL_REPLY = (
+    "⚠️ I am a medical awareness assistant.\n"
+    "Ask health/medicine questions.\n"
+    "If you uploaded a file, ask: 'Explain this pdf' / 'What medicine is in this image?'"
+)
+
+
+def _get_chat_and_text(chat_id: int, body: ChatSendIn, db: Session, user: User):
     chat = db.query(Chat).filter(Chat.id == chat_id, Chat.user_id == user.id).first()
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
@@ -256,90 +347,283 @@ async def send_message(
     if not user_text:
         raise HTTPException(status_code=400, detail="Message is empty")
 
+    return chat, user_text
+
+
+async def _prepare_turn(chat_id: int, user_text: str, db: Session) -> dict | None:
+    """
+    Saves the user message, runs the classifier and builds RAG context + history.
+    Returns None when the message is blocked as non-medical.
+    """
     # ✅ save user message
-    db.add(
-        Message(
-            chat_id=chat_id,
-            role="user",
-            content=user_text,
-            created_at=datetime.utcnow(),
-        )
+    user_msg = Message(
+        chat_id=chat_id,
+        role="user",
+        content=user_text,
+        created_at=datetime.utcnow(),
     )
+    db.add(user_msg)
     db.commit()
 
-    # ✅ 1) Medical intent classifier
-    medical = await is_medical_query_openrouter(user_text)
+    # ✅ 1) classifier, RAG retrieval and history run concurrently
+    # (Pinecone + DB are sync -> thread pool, never on the event loop)
+    cancelled = threading.Event()
+    doc_question = is_doc_question(user_text)
+
+    classify_task = asyncio.create_task(is_medical_query_openrouter(user_text))
+    history_task = asyncio.create_task(run_in_threadpool(_load_history, chat_id, user_msg.id))
+    context_task = None
+
+    try:
+        # ✅ which namespaces to hit, from the cached per-chat upload state
+        plan = await run_in_threadpool(plan_retrieval, chat_id, doc_question)
+        context_task = asyncio.create_task(
+            run_in_threadpool(
+                retrieve_multi, user_text, plan["sources"],
+                top_k=settings.RAG_TOP_K,
+                cancelled=cancelled,
+            )
+        )
+        # retrieval may be abandoned below: don't let its errors go unretrieved
+        context_task.add_done_callback(lambda t: t.cancelled() or t.exception())
 
-    has_docs = db.query(Document).filter(Document.chat_id == chat_id).first()
-    doc_q = is_doc_question(user_text)
+        medical = await classify_task
+        history = await history_task
+    except BaseException:
+        cancelled.set()
+        for t in (classify_task, context_task, history_task):
+            if t is not None:
+                t.cancel()
+        raise
+
+    has_docs = plan["docs"]["count"] > 0
 
     # ✅ PRIORITY: If user asks about uploaded doc/image -> allow even if classifier says NO
-    if has_docs and doc_q:
+    if has_docs and doc_question:
         medical = True
 
-    # ✅ If still non-medical -> block
+    # ✅ If still non-medical -> drop the speculative retrieval and block
     if not medical:
-        bot_text = (
-            "⚠️ I am a medical awareness assistant.\n"
-            "Ask health/medicine questions.\n"
-            "If you uploaded a file, ask: 'Explain this pdf' / 'What medicine is in this image?'"
+        cancelled.set()
+        context_task.cancel()
+        return None
+
+    # ✅ 2) RAG context: best chunks above threshold from the planned namespaces (may be none)
+    matches, qvec = await context_task
+    context = [m["text"] for m in matches]
+
+    return {"context": context, "history": history, "qvec": qvec, "has_docs": has_docs}
+
+
+def _cacheable(turn: dict) -> bool:
+    # the answer cache is shared by all users: only turns whose prompt is just
+    # question + book context. Chats with uploads are about the user's own
+    # files, and with history the answer depends on earlier turns
+    # ("I'm pregnant", the drug discussed before, ...). The fixed welcome
+    # message of a new chat is the same for everyone.
+    own_history = any(m["role"] == "user" for m in turn["history"])
+    return settings.ANSWER_CACHE_ENABLED and not turn["has_docs"] and not own_history
+
+
+async def _cached_answer(turn: dict, user_text: str, language: str) -> str | None:
+    if not _cacheable(turn):
+        return None
+    return await run_in_threadpool(answer_cache.get, user_text, language, turn["context"], turn["qvec"])
+
+
+async def _remember_answer(turn: dict, user_text: str, language: str, bot_text: str):
+    if not _cacheable(turn):
+        return
+    await run_in_threadpool(answer_cache.put, user_text, language, turn["context"], bot_text, turn["qvec"])
+
+
+def _load_history(chat_id: int, exclude_message_id: int) -> list:
+    """Runs in a worker thread, so it uses its own session."""
+    db = SessionLocal()
+    try:
+        # ✅ 3) chat history: NEWEST messages (prompt builder trims to the token budget);
+        # the current question is sent separately, so leave it out here
+        last_msgs = (
+            db.query(Message)
+            .filter(Message.chat_id == chat_id, Message.id != exclude_message_id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(settings.CHAT_HISTORY_MAX_MESSAGES)
+            .all()
         )
-        db.add(Message(chat_id=chat_id, role="assistant", content=bot_text, created_at=datetime.utcnow()))
-        chat.updated_at = datetime.utcnow()
-        db.commit()
-        return {"reply": bot_text, "chat_title": chat.title, "updated_at": chat.updated_at.isoformat()}
-
-
-    # ✅ 2) RAG context: global + chat
-    context_chat = retrieve_context_for_chat(chat_id=chat_id, query=user_text)
-
-# ✅ If uploaded doc context exists → use ONLY that
-    if context_chat:
-        context = context_chat
-    else:
-        global_ns = getattr(settings, "PINECONE_NAMESPACE", "global-medical")
-        context = retrieve_context_from_namespace(namespace=global_ns, query=user_text)
-
-
-    # ✅ 3) chat history (last 10)
-    last_msgs = (
-        db.query(Message)
-        .filter(Message.chat_id == chat_id)
-        .order_by(Message.created_at.asc())
-        .limit(10)
-        .all()
-    )
-    history = [{"role": m.role, "content": m.content} for m in last_msgs]
-
-    lang = body.language or "en"
-
-    # ✅ 4) Generate answer (RAG->NO_CONTEXT->fallback)
-    bot_text = await openrouter_chat(
-        model=settings.OPENROUTER_MODEL,
-        user_message=user_text,
-        chat_history=history,
-        rag_context=context,
-        language=lang,
-    )
-
+        return [{"role": m.role, "content": m.content} for m in reversed(last_msgs)]
+    finally:
+        db.close()
+
+
+# LLM title still being generated (polled via GET /{chat_id}/title). Kept on
+# the chat row so any API worker can answer the poll; a worker that died
+# mid-generation stops counting as pending after TITLE_PENDING_TIMEOUT.
+TITLE_PENDING_TIMEOUT = timedelta(seconds=60)
+_title_tasks: set[asyncio.Task] = set()
+
+
+def _title_is_pending(chat: Chat) -> bool:
+    since = chat.title_pending_since
+    return since is not None and datetime.utcnow() - since < TITLE_PENDING_TIMEOUT
+
+
+async def _refine_title(chat_id: int, placeholder: str, user_text: str):
+    """Background: replace the extractive placeholder with the LLM title."""
+    title = None
+    try:
+        title = await generate_chat_title(user_text)
+    except Exception as e:
+        print("Title generation failed:", e)
+
+    db = SessionLocal()
+    try:
+        chat = db.query(Chat).filter(Chat.id == chat_id).first()
+        if chat:
+            # user may have renamed the chat meanwhile
+            if title and chat.title == placeholder:
+                chat.title = title
+            chat.title_pending_since = None
+            db.commit()
+    except Exception as e:
+        print("Title save failed:", e)
+    finally:
+        db.close()
+
+
+async def _finish_turn(chat: Chat, user_text: str, bot_text: str, db: Session, generate_title: bool = True) -> dict:
     db.add(
         Message(
-            chat_id=chat_id,
+            chat_id=chat.id,
             role="assistant",
             content=bot_text,
             created_at=datetime.utcnow(),
         )
     )
 
-    # ✅ 5) server-side title generation
-    if chat.title == "New Chat":
-        chat.title = await generate_chat_title(user_text)
+    # ✅ title: instant extractive placeholder now, LLM title after the reply
+    refine = generate_title and chat.title == "New Chat"
+    if refine:
+        chat.title = quick_chat_title(user_text)
+        chat.title_pending_since = datetime.utcnow()
 
     chat.updated_at = datetime.utcnow()
     db.commit()
 
+    if refine:
+        task = asyncio.create_task(_refine_title(chat.id, chat.title, user_text))
+        _title_tasks.add(task)
+        task.add_done_callback(_title_tasks.discard)
+
     return {
         "reply": bot_text,
         "chat_title": chat.title,
         "updated_at": chat.updated_at.isoformat(),
+        "title_pending": _title_is_pending(chat),
     }
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# -----------------------
+# Send Message (Classifier + RAG + Fallback)
+# -----------------------
+@router.post("/{chat_id}/send", response_model=ChatSendOut)
+async def send_message(
+    chat_id: int,
+    body: ChatSendIn,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    chat, user_text = _get_chat_and_text(chat_id, body, db, user)
+
+    turn = await _prepare_turn(chat_id, user_text, db)
+    if turn is None:
+        return await _finish_turn(chat, user_text, NON_MEDICAL_REPLY, db, generate_title=False)
+
+    lang = body.language or "en"
+
+    # ✅ 4) Cached answer, else generate (one call: RAG prompt or general fallback)
+    bot_text = await _cached_answer(turn, user_text, lang)
+    if bot_text is None:
+        bot_text = await openrouter_chat(
+            model=settings.OPENROUTER_MODEL,
+            user_message=user_text,
+            chat_history=turn["history"],
+            rag_context=turn["context"],
+            language=lang,
+        )
+        await _remember_answer(turn, user_text, lang, bot_text)
+
+    return await _finish_turn(chat, user_text, bot_text, db)
+
+
+# -----------------------
+# Send Message (SSE stream)
+# -----------------------
+@router.post("/{chat_id}/send/stream")
+async def send_message_stream(
+    chat_id: int,
+    body: ChatSendIn,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """
+    Same pipeline as /send, but the answer is streamed as Server-Sent Events:
+      event: delta  data: {"text": "..."}           (repeated)
+      event: done   data: {reply, chat_title, updated_at}
+      event: error  data: {"detail": "..."}
+    The assistant Message row is saved once the stream has finished.
+    """
+    chat, user_text = _get_chat_and_text(chat_id, body, db, user)
+    turn = await _prepare_turn(chat_id, user_text, db)
+
+    async def events():
+        # own session: the request-scoped one may already be closed while streaming
+        sdb = SessionLocal()
+        try:
+            schat = sdb.query(Chat).filter(Chat.id == chat_id).first()
+
+            if turn is None:
+                yield _sse("delta", {"text": NON_MEDICAL_REPLY})
+                out = await _finish_turn(schat, user_text, NON_MEDICAL_REPLY, sdb, generate_title=False)
+                yield _sse("done", out)
+                return
+
+            lang = body.language or "en"
+            cached = await _cached_answer(turn, user_text, lang)
+            if cached is not None:
+                yield _sse("delta", {"text": cached})
+                out = await _finish_turn(schat, user_text, cached, sdb)
+                yield _sse("done", out)
+                return
+
+            parts: list[str] = []
+            try:
+                async for delta in openrouter_chat_stream(
+                    model=settings.OPENROUTER_MODEL,
+                    user_message=user_text,
+                    chat_history=turn["history"],
+                    rag_context=turn["context"],
+                    language=lang,
+                ):
+                    parts.append(delta)
+                    yield _sse("delta", {"text": delta})
+            except httpx.HTTPError as e:
+                print("OpenRouter stream error:", e)
+                yield _sse("error", {"detail": "Model request failed"})
+                return
+
+            bot_text = "".join(parts).strip()
+            await _remember_answer(turn, user_text, lang, bot_text)
+            out = await _finish_turn(schat, user_text, bot_text, sdb)
+            yield _sse("done", out)
+        finally:
+            sdb.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
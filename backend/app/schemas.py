@@ -57,6 +57,12 @@ class ChatSendOut(BaseModel):
     reply: str
     chat_title: str
     updated_at: str
+    title_pending: bool = False  # ✅ final LLM title not ready yet -> poll /chat/{id}/title
+
+
+class ChatTitleOut(BaseModel):
+    title: str
+    pending: bool
 
 
 class MessageOut(BaseModel):
@@ -64,3 +70,12 @@ class MessageOut(BaseModel):
     role: str
     content: str
     created_at: str
+
+
+class DocumentOut(BaseModel):
+    id: int
+    filename: str
+    status: str  # queued | extracting | embedding | ready | failed
+    chunks: int
+    error: Optional[str] = None
+    created_at: str
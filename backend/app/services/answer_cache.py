@@ -0,0 +1,231 @@
+# app/services/answer_cache.py
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from app.config import settings
+
+
+def normalize_question(text: str) -> str:
+    t = (text or "").lower()
+    t = re.sub(r"[^\w\s]", " ", t)
+    return re.sub(r"\s+", " ", t).strip()
+
+
+def context_fingerprint(context: List[str] | str) -> str:
+    if not isinstance(context, str):
+        context = "\n\n".join(context or [])
+    t = re.sub(r"\s+", " ", context or "").strip()
+    if not t:
+        return "none"
+    return hashlib.sha256(t.encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    """
+    Cache of final chat answers.
+
+    Key = normalized question + language + fingerprint of the RAG context, so
+    an answer is only reused when the model would have seen the same prompt.
+    The cache is shared by every user, so callers only use it for turns sent
+    without chat history (routes_chat._cacheable).
+    Lookup is exact first, then (optionally) by cosine similarity of the query
+    embedding among entries with the same language + context fingerprint.
+
+    In-memory LRU with TTL, written through to SQLite so it survives restarts.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: int, similarity: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.similarity = similarity
+
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, dict]" = OrderedDict()
+        self._loaded = False
+        self._stats = {"hits_exact": 0, "hits_similar": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    # ---------- sqlite ----------
+    def _conn(self):
+        return sqlite3.connect(self.path)
+
+    def _load(self):
+        if self._loaded:
+            return
+        conn = self._conn()
+        cur = conn.cursor()
+        # v1 rows may hold answers written for a conversation's history
+        cur.execute("DROP TABLE IF EXISTS answer_cache")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS answer_cache_v2 (
+                key TEXT PRIMARY KEY,
+                language TEXT,
+                ctx_fp TEXT,
+                question TEXT,
+                answer TEXT,
+                embedding BLOB,
+                created_at REAL,
+                last_hit REAL
+            )
+        """)
+        conn.commit()
+
+        cur.execute("DELETE FROM answer_cache_v2 WHERE created_at < ?", (time.time() - self.ttl,))
+        conn.commit()
+
+        cur.execute(
+            "SELECT key, language, ctx_fp, question, answer, embedding, created_at "
+            "FROM answer_cache_v2 ORDER BY last_hit DESC LIMIT ?",
+            (self.max_entries,),
+        )
+        rows = cur.fetchall()
+        conn.close()
+
+        for key, lang, ctx_fp, question, answer, emb, created_at in reversed(rows):
+            self._mem[key] = {
+                "language": lang,
+                "ctx_fp": ctx_fp,
+                "question": question,
+                "answer": answer,
+                "embedding": np.frombuffer(emb, dtype=np.float32) if emb else None,
+                "created_at": created_at,
+            }
+        self._loaded = True
+
+    def _db_write(self, sql: str, params: tuple):
+        try:
+            conn = self._conn()
+            conn.execute(sql, params)
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print("Answer cache write failed:", e)
+
+    # ---------- helpers ----------
+    @staticmethod
+    def _key(question: str, language: str, ctx_fp: str) -> str:
+        raw = f"{normalize_question(question)}|{(language or 'en').lower()}|{ctx_fp}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _unit(vec: Optional[List[float]]) -> Optional[np.ndarray]:
+        if vec is None:
+            return None
+        v = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n else None
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        return now - entry["created_at"] > self.ttl
+
+    def _drop(self, key: str):
+        self._mem.pop(key, None)
+        self._db_write("DELETE FROM answer_cache_v2 WHERE key = ?", (key,))
+
+    # ---------- public ----------
+    def get(self, question: str, language: str, context: List[str] | str, qvec: Optional[List[float]] = None) -> Optional[str]:
+        ctx_fp = context_fingerprint(context)
+        key = self._key(question, language, ctx_fp)
+        now = time.time()
+
+        with self._lock:
+            self._load()
+
+            hit_key = None
+            entry = self._mem.get(key)
+            if entry and not self._expired(entry, now):
+                hit_key = key
+                self._stats["hits_exact"] += 1
+            elif entry:
+                self._drop(key)
+
+            if hit_key is None and self.similarity > 0:
+                q = self._unit(qvec)
+                if q is not None:
+                    lang = (language or "en").lower()
+                    best, best_sim = None, self.similarity
+                    for k, e in self._mem.items():
+                        emb = e["embedding"]
+                        if emb is None or e["language"] != lang or e["ctx_fp"] != ctx_fp:
+                            continue
+                        if emb.shape != q.shape or self._expired(e, now):
+                            continue
+                        sim = float(np.dot(q, emb))
+                        if sim >= best_sim:
+                            best, best_sim = k, sim
+                    if best is not None:
+                        hit_key = best
+                        self._stats["hits_similar"] += 1
+
+            if hit_key is None:
+                self._stats["misses"] += 1
+                return None
+
+            self._mem.move_to_end(hit_key)
+            answer = self._mem[hit_key]["answer"]
+
+        self._db_write("UPDATE answer_cache_v2 SET last_hit = ? WHERE key = ?", (now, hit_key))
+        return answer
+
+    def put(self, question: str, language: str, context: List[str] | str, answer: str, qvec: Optional[List[float]] = None):
+        answer = (answer or "").strip()
+        if not answer:
+            return
+
+        ctx_fp = context_fingerprint(context)
+        key = self._key(question, language, ctx_fp)
+        emb = self._unit(qvec)
+        now = time.time()
+
+        with self._lock:
+            self._load()
+            self._mem[key] = {
+                "language": (language or "en").lower(),
+                "ctx_fp": ctx_fp,
+                "question": question,
+                "answer": answer,
+                "embedding": emb,
+                "created_at": now,
+            }
+            self._mem.move_to_end(key)
+            self._stats["stores"] += 1
+
+            evicted = []
+            while len(self._mem) > self.max_entries:
+                old_key, _ = self._mem.popitem(last=False)
+                evicted.append(old_key)
+                self._stats["evictions"] += 1
+
+        self._db_write(
+            "INSERT OR REPLACE INTO answer_cache_v2 "
+            "(key, language, ctx_fp, question, answer, embedding, created_at, last_hit) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, (language or "en").lower(), ctx_fp, question, answer,
+             emb.tobytes() if emb is not None else None, now, now),
+        )
+        for k in evicted:
+            self._db_write("DELETE FROM answer_cache_v2 WHERE key = ?", (k,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["size"] = len(self._mem)
+        lookups = s["hits_exact"] + s["hits_similar"] + s["misses"]
+        s["hit_rate"] = round((s["hits_exact"] + s["hits_similar"]) / lookups, 4) if lookups else 0.0
+        return s
+
+
+answer_cache = AnswerCache(
+    path=settings.ANSWER_CACHE_PATH,
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity=settings.ANSWER_CACHE_SIMILARITY,
+)
@@ -0,0 +1,68 @@
+# app/services/http_client.py
+
+import importlib.util
+
+import httpx
+
+from app.config import settings
+
+
+class OpenRouterHTTP:
+    """
+    One process-wide httpx.AsyncClient for OpenRouter.
+
+    Keeps TCP/TLS connections alive between calls (classifier, title, chat)
+    instead of paying a fresh handshake per request. Opened/closed by the
+    FastAPI lifespan in app.main; created lazily if used outside of it
+    (scripts, ingest jobs).
+    """
+
+    def __init__(self):
+        self._client: httpx.AsyncClient | None = None
+
+    def _build(self) -> httpx.AsyncClient:
+        http2 = bool(settings.OPENROUTER_HTTP2)
+        if http2 and importlib.util.find_spec("h2") is None:
+            print("⚠️ h2 not installed → OpenRouter client falls back to HTTP/1.1")
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=settings.OPENROUTER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENROUTER_MAX_KEEPALIVE,
+            keepalive_expiry=settings.OPENROUTER_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(
+            connect=settings.OPENROUTER_CONNECT_TIMEOUT,
+            read=settings.OPENROUTER_READ_TIMEOUT,
+            write=settings.OPENROUTER_WRITE_TIMEOUT,
+            pool=settings.OPENROUTER_POOL_TIMEOUT,
+        )
+        return httpx.AsyncClient(
+            base_url=settings.OPENROUTER_BASE_URL.rstrip("/"),
+            http2=http2,
+            limits=limits,
+            timeout=timeout,
+            headers={
+                "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
+                "Content-Type": "application/json",
+                # "HTTP-Referer": "http://localhost",
+                # "X-Title": "HealthBot",
+            },
+        )
+
+    def start(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build()
+        return self._client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self.start()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+openrouter_http = OpenRouterHTTP()
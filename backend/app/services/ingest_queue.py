@@ -0,0 +1,261 @@
+# app/services/ingest_queue.py
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Document, Chat
+from app.rag.vectorstore import read_file_text, upsert_text_to_chat
+from app.services.retrieval_planner import doc_registry
+
+IMAGE_EXTS = {".png", ".jpg", ".jpeg"}
+ACTIVE_STATUSES = ("queued", "extracting", "embedding")
+
+
+class IngestQueue:
+    """
+    Bounded worker pool for chat uploads: extract (OCR / PDF) -> chunk ->
+    embed -> upsert, off the request path. Progress lives on Document.status
+    so any API worker can answer status polls.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool: ThreadPoolExecutor | None = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._mine: set[int] = set()  # submitted here, not finished: claims this process renews
+        self._stop = threading.Event()
+        self._ticker: threading.Thread | None = None
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+            return self._pool
+
+    def submit(self, doc_id: int) -> bool:
+        """False when max_pending jobs are already queued/running."""
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._mine.add(doc_id)
+        try:
+            self._executor().submit(self._run, doc_id)
+        except RuntimeError:
+            self._done(doc_id)
+            return False
+        return True
+
+    def _done(self, doc_id: int):
+        with self._lock:
+            self._mine.discard(doc_id)
+        self._slots.release()
+
+    @staticmethod
+    def _claim(doc_id: int) -> bool:
+        """
+        Atomically take an unfinished upload nobody touched for
+        INGEST_CLAIM_SECONDS; every API worker sweeps for those (at startup
+        and every INGEST_SWEEP_SECONDS) and only one of them may win each
+        document.
+        """
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=settings.INGEST_CLAIM_SECONDS)
+        db = SessionLocal()
+        try:
+            n = (
+                db.query(Document)
+                .filter(
+                    Document.id == doc_id,
+                    Document.status.in_(ACTIVE_STATUSES),
+                    or_(Document.claimed_at.is_(None), Document.claimed_at < stale),
+                )
+                .update({Document.claimed_at: now}, synchronize_session=False)
+            )
+            db.commit()
+            return n == 1
+        finally:
+            db.close()
+
+    @staticmethod
+    def _release(doc_id: int):
+        db = SessionLocal()
+        try:
+            db.query(Document).filter(Document.id == doc_id).update(
+                {Document.claimed_at: None}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _sweep(self) -> tuple[int, int, int]:
+        """Claims + re-queues stale unfinished uploads. (resumed, taken by others, left for later)."""
+        db = SessionLocal()
+        try:
+            ids = [d.id for d in db.query(Document.id).filter(Document.status.in_(ACTIVE_STATUSES)).all()]
+        finally:
+            db.close()
+        with self._lock:
+            ids = [i for i in ids if i not in self._mine]
+
+        resumed = taken = left = 0
+        for i, doc_id in enumerate(ids):
+            if not self._claim(doc_id):
+                taken += 1
+                continue
+            if not self.submit(doc_id):
+                self._release(doc_id)
+                left = len(ids) - i
+                break
+            resumed += 1
+        return resumed, taken, left
+
+    def resume_pending(self):
+        """Re-queue documents left half-processed by a previous process."""
+        resumed, taken, left = self._sweep()
+        if resumed:
+            print(f"📥 Re-queued {resumed} unfinished upload(s)")
+        if taken:
+            print(f"ℹ️ {taken} unfinished upload(s) touched in the last {settings.INGEST_CLAIM_SECONDS}s "
+                  f"-> left to the worker that has them")
+        if left:
+            print(f"⚠️ {left} unfinished upload(s) not re-queued: INGEST_MAX_PENDING={self.max_pending} reached; "
+                  f"retried every {settings.INGEST_SWEEP_SECONDS}s")
+
+    def _heartbeat(self):
+        """Renews the claim of every upload queued or running here (OCR of a big scan can outlast a claim)."""
+        with self._lock:
+            ids = list(self._mine)
+        if not ids:
+            return
+        db = SessionLocal()
+        try:
+            db.query(Document).filter(
+                Document.id.in_(ids), Document.status.in_(ACTIVE_STATUSES)
+            ).update({Document.claimed_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _tick(self):
+        # heartbeats well inside the claim window; a claim that still went
+        # stale (worker restarted mid-job) is picked up by the sweep
+        every = max(1.0, min(settings.INGEST_SWEEP_SECONDS, settings.INGEST_CLAIM_SECONDS / 3))
+        while not self._stop.wait(every):
+            try:
+                self._heartbeat()
+                resumed, _, _ = self._sweep()
+                if resumed:
+                    print(f"📥 Re-queued {resumed} stale upload(s)")
+            except Exception as e:
+                print("Ingest sweep failed:", e)
+
+    def start(self):
+        """resume_pending() now, then heartbeat + sweep in the background."""
+        self.resume_pending()
+        with self._lock:
+            if self._ticker is None:
+                self._stop.clear()
+                self._ticker = threading.Thread(target=self._tick, name="ingest-sweep", daemon=True)
+                self._ticker.start()
+
+    def shutdown(self):
+        self._stop.set()
+        with self._lock:
+            self._ticker = None
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    # ---------- worker ----------
+    def _set(self, db, doc: Document, **fields):
+        for k, v in fields.items():
+            setattr(doc, k, v)
+        doc.claimed_at = datetime.utcnow()  # heartbeat: resume_pending leaves it alone
+        db.commit()
+        # the retrieval planner only searches chats with ready uploads
+        doc_registry.invalidate(doc.chat_id)
+
+    def _run(self, doc_id: int):
+        db = SessionLocal()
+        try:
+            doc = db.query(Document).filter(Document.id == doc_id).first()
+            if not doc:
+                return
+
+            try:
+                self._set(db, doc, status="extracting", error=None)
+                text = extract_document_text(doc.path)
+
+                self._set(db, doc, status="embedding")
+                n = upsert_text_to_chat(doc.chat_id, text, doc.filename or os.path.basename(doc.path))
+
+                self._set(db, doc, status="ready", chunks=n)
+
+                chat = db.query(Chat).filter(Chat.id == doc.chat_id).first()
+                if chat:
+                    chat.updated_at = datetime.utcnow()
+                    db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"❌ Ingest failed for document {doc_id}:", e)
+                self._set(db, doc, status="failed", error=str(e)[:500])
+        finally:
+            db.close()
+            self._done(doc_id)
+
+
+def extract_document_text(path: str) -> str:
+    """
+    Text for RAG. Uploads are content-addressed, so the extracted text of a
+    PDF/image is kept next to it as <file>.txt and reused by every later
+    upload of the same bytes (no second OCR; re-embedding hits embed_cache).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in {".txt", ".md"}:
+        return read_file_text(path)
+
+    sidecar = path + ".txt"
+    if os.path.exists(sidecar):
+        with open(sidecar, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+
+    missed = []  # scanned PDF pages OCR could not read
+    if ext in IMAGE_EXTS:
+        try:
+            from app.utils.ocr import extract_text_from_image
+            text = extract_text_from_image(path)
+        except Exception as e:
+            print("OCR error:", e)
+            text = ""
+    elif ext == ".pdf":
+        from app.rag.pdf_utils import extract_text_from_pdf
+        text = extract_text_from_pdf(path, missed)
+    else:
+        text = read_file_text(path)
+
+    # the sidecar is shared by every upload of these bytes: never cache a
+    # failure (no text, or pages OCR was needed for but missing / broken)
+    # -> retried next upload. A PDF read fully from its text layer is cached
+    # with or without OCR installed.
+    if not (text or "").strip() or missed:
+        return text or ""
+
+    tmp = f"{sidecar}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, sidecar)
+    return text
+
+
+ingest_queue = IngestQueue(
+    workers=settings.INGEST_WORKERS,
+    max_pending=settings.INGEST_MAX_PENDING,
+)
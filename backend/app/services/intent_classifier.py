@@ -0,0 +1,154 @@
+# app/services/intent_classifier.py
+
+import os
+import re
+import threading
+from typing import Iterable, Optional
+
+import joblib
+
+from app.config import settings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# ---------------------------
+# Phrase automaton
+# ---------------------------
+class PhraseMatcher:
+    """
+    Compiles a phrase list into ONE regex built from a prefix trie, with word
+    boundaries on both sides (so "pain" no longer fires on "painting"). A
+    hyphen is a boundary: "covid-19" and "post-covid" still hit "covid".
+    A single pass over the text replaces the old `any(k in q for k in ...)`.
+    """
+
+    def __init__(self, phrases: Iterable[str], plurals: bool = True):
+        trie: dict = {}
+        for p in phrases:
+            words = p.lower().split()
+            if not words:
+                continue
+            node = trie
+            for ch in " ".join(words):
+                node = node.setdefault(ch, {})
+            node[""] = {}  # end marker
+
+        body = self._to_regex(trie)
+        suffix = r"(?:s|es)?" if plurals else ""
+        self._re = re.compile(rf"(?<!\w)(?:{body}){suffix}(?!\w)")
+
+    @classmethod
+    def _to_regex(cls, node: dict) -> str:
+        alts = []
+        optional = False
+        for ch, child in sorted(node.items()):
+            if ch == "":
+                optional = True
+                continue
+            piece = r"\s+" if ch == " " else re.escape(ch)
+            alts.append(piece + cls._to_regex(child) if child else piece)
+
+        if not alts:
+            return ""
+        out = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if optional:
+            out = "(?:" + out + ")?"
+        return out
+
+    def search(self, text: str) -> Optional[str]:
+        m = self._re.search((text or "").lower())
+        return m.group(0) if m else None
+
+
+MEDICAL_PHRASES = [
+    "medicine", "medication", "tablet", "capsule", "syrup", "drug",
+    "dose", "dosage", "prescription", "side effect", "contraindication",
+    "fever", "cough", "cold", "pain", "headache", "bp", "sugar",
+    "infection", "disease", "symptom", "treatment", "diagnosis",
+    "antibiotic", "paracetamol", "ibuprofen", "dolo", "azith", "azithromycin",
+    "rash", "vomit", "vomiting", "diarrhea", "asthma", "diabetes", "hypertension",
+    "what is this medicine", "what is this tablet",
+    "doctor", "hospital", "health", "blood", "blood test", "blood pressure",
+    "x-ray", "xray", "mri", "ct scan", "ecg", "lab report",
+    "allergy", "injury", "wound", "burn", "fracture", "vaccine",
+    "pregnancy", "pregnant", "period", "migraine", "nausea", "dizziness",
+    "dengue", "malaria", "typhoid", "covid", "jaundice", "thyroid", "cholesterol",
+]
+
+DOC_PHRASES = [
+    "this pdf", "in this pdf", "from this pdf",
+    "this file", "in this file", "from this file",
+    "this document", "in this document", "from this document",
+    "this image", "in this image", "from this image",
+    "this photo", "in this photo", "from this photo",
+    "uploaded file", "uploaded", "upload", "uploading", "attachment",
+    "above image", "given image",
+    "extract", "summarize", "summary", "explain this",
+    "what is written", "what does it say",
+    "medicine name", "tablet name", "drug name",
+]
+
+medical_matcher = PhraseMatcher(MEDICAL_PHRASES)
+doc_matcher = PhraseMatcher(DOC_PHRASES)
+
+
+# ---------------------------
+# Linear model (trained by ml_assets/train_intent.py)
+# ---------------------------
+_model = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+
+def _load_model():
+    global _model, _model_loaded
+    if _model_loaded:
+        return _model
+
+    with _model_lock:
+        if not _model_loaded:
+            path = settings.INTENT_MODEL_PATH
+            if not os.path.isabs(path):
+                path = os.path.join(BACKEND_DIR, path)
+            try:
+                _model = joblib.load(path)
+            except Exception as e:
+                print("⚠️ Intent model not loaded:", e)
+                _model = None
+            _model_loaded = True
+    return _model
+
+
+def classify_medical(text: str) -> dict:
+    """
+    Local medical-intent decision.
+
+    Returns {"medical": bool | None, "confidence": float, "source": str}
+      source "keyword" -> phrase automaton hit (confidence 1.0)
+      source "model"   -> linear model, confidence = P(medical)
+      source "none"    -> no model available
+    "medical" is None when the model is unsure (between the two thresholds);
+    the caller decides whether to escalate to the LLM.
+    """
+    q = (text or "").strip()
+
+    if medical_matcher.search(q):
+        return {"medical": True, "confidence": 1.0, "source": "keyword"}
+
+    model = _load_model()
+    if model is None:
+        return {"medical": None, "confidence": 0.5, "source": "none"}
+
+    classes = list(model.classes_)
+    p = float(model.predict_proba([q.lower()])[0][classes.index("medical")])
+
+    if p >= settings.INTENT_MEDICAL_THRESHOLD:
+        return {"medical": True, "confidence": p, "source": "model"}
+    if p <= settings.INTENT_OTHER_THRESHOLD:
+        return {"medical": False, "confidence": p, "source": "model"}
+    return {"medical": None, "confidence": p, "source": "model"}
+
+
+def is_doc_question(text: str) -> bool:
+    return doc_matcher.search(text) is not None
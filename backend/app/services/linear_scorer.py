@@ -0,0 +1,228 @@
+# app/services/linear_scorer.py
+#
+# Compiled form of the symptom VotingClassifier (LogisticRegression + linear
+# SVC with probability=True). Both members are linear in the TF-IDF vector,
+# so the whole ensemble is one sparse x dense product followed by
+# - softmax            (multinomial LogisticRegression)
+# - Platt + coupling   (libsvm one-vs-one probabilities)
+# and a weighted average. The artifact is a dict of numpy arrays: loading it
+# never unpickles an sklearn estimator.
+#
+# No app.config import here: ml_assets/train.py uses this to export.
+
+import itertools
+from typing import Optional
+
+import joblib
+import numpy as np
+
+FORMAT = "voting-linear-v1"
+MIN_PROB = 1e-7  # libsvm clips pairwise probabilities to [1e-7, 1 - 1e-7]
+
+
+# ---------------------------
+# Export
+# ---------------------------
+def compile_voting(model, encoder, dtype=np.float32) -> dict:
+    """
+    Plain-array artifact for a fitted soft VotingClassifier of linear LR / SVC
+    members. Weights are stored as float32 by default (half the size; the
+    probabilities move by ~1e-8), the rest as float64.
+    """
+    if getattr(model, "voting", None) != "soft":
+        raise ValueError("only soft-voting ensembles can be compiled")
+
+    n_classes = len(model.classes_)
+    weights = np.ones(len(model.estimators_)) if model.weights is None else np.asarray(model.weights, float)
+    weights = weights / weights.sum()
+
+    blocks, mats, biases = [], [], []
+    col = 0
+    for est, weight in zip(model.estimators_, weights):
+        kind = type(est).__name__
+        if kind == "LogisticRegression":
+            coef = np.asarray(est.coef_, dtype=np.float64)
+            if coef.shape[0] != n_classes:
+                raise ValueError("LogisticRegression must be multinomial (one row per class)")
+            blocks.append({"kind": "softmax", "start": col, "stop": col + n_classes, "weight": float(weight)})
+            mats.append(coef.T)
+            biases.append(np.asarray(est.intercept_, dtype=np.float64))
+            col += n_classes
+        elif kind == "SVC":
+            if est.kernel != "linear" or not est.probability:
+                raise ValueError("SVC must use kernel='linear' and probability=True")
+            coef = est.coef_
+            coef = coef.toarray() if hasattr(coef, "toarray") else np.asarray(coef)
+            n_pairs = n_classes * (n_classes - 1) // 2
+            if coef.shape[0] != n_pairs:
+                raise ValueError("SVC must be one-vs-one over every class")
+            blocks.append({"kind": "ovo_platt", "start": col, "stop": col + n_pairs, "weight": float(weight)})
+            mats.append(coef.T.astype(np.float64))
+            biases.append(np.asarray(est.intercept_, dtype=np.float64))
+            col += n_pairs
+            prob_a = np.asarray(est.probA_, dtype=np.float64)
+            prob_b = np.asarray(est.probB_, dtype=np.float64)
+        else:
+            raise ValueError(f"cannot compile {kind} (only LogisticRegression / SVC)")
+
+        if not np.array_equal(np.asarray(est.classes_), np.arange(n_classes)):
+            raise ValueError(f"{kind} classes are not the ensemble's")
+
+    artifact = {
+        "format": FORMAT,
+        "n_classes": n_classes,
+        "n_features": mats[0].shape[0],
+        "labels": np.asarray([str(x) for x in encoder.inverse_transform(model.classes_)]),
+        "blocks": blocks,
+        # (n_features, n_columns), C order: a CSR row is a gather of rows of W
+        "W": np.ascontiguousarray(np.hstack(mats), dtype=dtype),
+        "b": np.concatenate(biases),
+    }
+    if any(b["kind"] == "ovo_platt" for b in blocks):
+        pairs = np.asarray(list(itertools.combinations(range(n_classes), 2)), dtype=np.int64)
+        artifact.update({"prob_a": prob_a, "prob_b": prob_b, "pair_i": pairs[:, 0], "pair_j": pairs[:, 1]})
+    return artifact
+
+
+def max_abs_diff(scorer: "LinearScorer", model, X) -> float:
+    """Largest absolute difference from model.predict_proba on X."""
+    if X.shape[0] == 0:
+        return 0.0
+    return float(np.abs(scorer.predict_proba(X) - model.predict_proba(X)).max())
+
+
+def export_linear(model, encoder, path: str, X_check=None, atol: float = 1e-6) -> dict:
+    """
+    Compiles `model`, checks it against predict_proba on X_check (raises if
+    any probability is further than atol) and joblib-dumps it to `path`.
+    """
+    artifact = compile_voting(model, encoder)
+    info = {"path": path, "max_abs_diff": None}
+    if X_check is not None:
+        diff = max_abs_diff(LinearScorer(artifact), model, X_check)
+        info["max_abs_diff"] = diff
+        if diff > atol:
+            raise ValueError(f"compiled scorer differs from the model by {diff:.2e} (> {atol:.0e})")
+    joblib.dump(artifact, path)
+    return info
+
+
+# ---------------------------
+# Runtime
+# ---------------------------
+def _softmax(z: np.ndarray) -> np.ndarray:
+    e = np.exp(z - z.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def _couple_one(Q: np.ndarray, diag: np.ndarray, eps: float, max_iter: int) -> np.ndarray:
+    # single row: same updates as _couple with python floats for the scalars
+    k = len(diag)
+    diag = diag.tolist()
+    u = np.full(k, 1.0 / k)
+    v = Q @ u
+    w = float(u @ v)
+    s = 1.0
+    for _ in range(max_iter):
+        if np.abs(v / s - w / (s * s)).max() < eps:
+            break
+        for t in range(k):
+            vt = float(v[t])
+            d = (w / s - vt) / diag[t]
+            w += d * (2 * vt + d * diag[t])
+            u[t] += d
+            v += d * Q[t]
+            s += d
+    return u / s
+
+
+def _couple(r: np.ndarray, pair_i: np.ndarray, pair_j: np.ndarray, k: int) -> np.ndarray:
+    """
+    libsvm's multiclass_probability (Wu, Lin & Weng method 2) for every row
+    of pairwise probabilities r (n, k*(k-1)/2), with libsvm's start point,
+    update order and stopping rule, so the result matches sklearn's.
+
+    libsvm renormalises p after each coordinate step; here p = u / s is kept
+    unnormalised (v = Q u, w = u'Q u) so a step costs O(k), not O(k^2).
+    """
+    n = r.shape[0]
+    R = np.zeros((n, k, k))
+    R[:, pair_i, pair_j] = r
+    R[:, pair_j, pair_i] = 1.0 - r
+
+    idx = np.arange(k)
+    Q = -R.transpose(0, 2, 1) * R          # Q[t, j] = -r_jt * r_tj
+    diag = (R * R).sum(axis=1)             # Q[t, t] = sum_j r_jt^2
+    Q[:, idx, idx] = diag
+
+    eps = 0.005 / k
+    max_iter = max(100, k)
+    if n == 1:
+        return _couple_one(Q[0], diag[0], eps, max_iter)[None, :]
+
+    u = np.full((n, k), 1.0 / k)
+    v = np.einsum("ntj,nj->nt", Q, u)
+    w = (u * v).sum(axis=1)
+    s = np.ones(n)
+
+    rows = np.arange(n)
+    for _ in range(max_iter):
+        # libsvm: stop once max_t |(Qp)_t - p'Qp| < eps (per row)
+        ss = s[rows]
+        err = np.abs(v[rows] / ss[:, None] - (w[rows] / (ss * ss))[:, None]).max(axis=1)
+        rows = rows[err >= eps]
+        if not rows.size:
+            break
+        uu, vv, ww, ss, QQ, dd = u[rows], v[rows], w[rows], s[rows], Q[rows], diag[rows]
+        for t in range(k):
+            vt = vv[:, t]
+            d = (ww / ss - vt) / dd[:, t]
+            ww = ww + d * (2 * vt + d * dd[:, t])
+            uu[:, t] += d
+            vv += d[:, None] * QQ[:, t, :]
+            ss = ss + d
+        u[rows], v[rows], w[rows], s[rows] = uu, vv, ww, ss
+    return u / s[:, None]
+
+
+class LinearScorer:
+    """predict_proba of the compiled ensemble; X is the vectorizer's CSR output."""
+
+    def __init__(self, artifact: dict):
+        if artifact.get("format") != FORMAT:
+            raise ValueError(f"unknown linear artifact format: {artifact.get('format')}")
+        self.W = artifact["W"]
+        self.b = artifact["b"]
+        self.blocks = artifact["blocks"]
+        self.n_classes = int(artifact["n_classes"])
+        self.n_features = int(artifact["n_features"])
+        self.labels = artifact["labels"]
+        self.prob_a: Optional[np.ndarray] = artifact.get("prob_a")
+        self.prob_b: Optional[np.ndarray] = artifact.get("prob_b")
+        self.pair_i = artifact.get("pair_i")
+        self.pair_j = artifact.get("pair_j")
+
+    def decision(self, X) -> np.ndarray:
+        """X @ W + b; a single row is a gather of the rows of W it touches."""
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"expected {self.n_features} features, got {X.shape[1]}")
+        if X.shape[0] == 1:
+            start, stop = X.indptr[0], X.indptr[1]
+            z = X.data[start:stop] @ self.W[X.indices[start:stop]]
+            return (z + self.b)[None, :]
+        return np.asarray(X @ self.W) + self.b
+
+    def predict_proba(self, X) -> np.ndarray:
+        Z = self.decision(X)
+        probs = np.zeros((Z.shape[0], self.n_classes))
+        for block in self.blocks:
+            z = Z[:, block["start"]:block["stop"]]
+            if block["kind"] == "softmax":
+                p = _softmax(z)
+            else:
+                # libsvm sigmoid_predict: 1 / (1 + exp(A f + B)), overflow-safe
+                r = 0.5 - 0.5 * np.tanh(0.5 * (z * self.prob_a + self.prob_b))
+                r = np.clip(r, MIN_PROB, 1.0 - MIN_PROB)
+                p = _couple(r, self.pair_i, self.pair_j, self.n_classes)
+            probs += block["weight"] * p
+        return probs
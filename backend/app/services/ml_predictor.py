@@ -1,31 +1,95 @@
 # backend/app/services/ml_predictor.py
 import os
-import joblib
+from typing import List
+
 import numpy as np
 
-BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))  # -> backend/
+from app.config import settings
+from app.services.linear_scorer import LinearScorer
+from app.services.model_registry import model_registry
 
-MODEL_PATH = os.path.join(BACKEND_DIR, "disease_model.pkl")
-VECTORIZER_PATH = os.path.join(BACKEND_DIR, "vectorizer.pkl")
-ENCODER_PATH = os.path.join(BACKEND_DIR, "label_encoder.pkl")
+MODEL_FILE = "disease_model.pkl"
+VECTORIZER_FILE = "vectorizer.pkl"
+ENCODER_FILE = "label_encoder.pkl"
+LINEAR_FILE = "disease_linear.pkl"  # compiled model (ml_assets/train.py export)
 
-_model = joblib.load(MODEL_PATH)
-_vectorizer = joblib.load(VECTORIZER_PATH)
-_encoder = joblib.load(ENCODER_PATH)
+_linear = {"artifact": None, "scorer": None}
+
+
+def load_symptom_model():
+    """(model, vectorizer, encoder) from the shared registry; loaded on first call."""
+    return model_registry.get_many([MODEL_FILE, VECTORIZER_FILE, ENCODER_FILE])
+
+
+def load_linear_scorer():
+    """
+    (scorer, vectorizer) when the compiled model is deployed and enabled,
+    else None -> callers use the sklearn model.
+    """
+    if not settings.ML_LINEAR_SCORER or not os.path.exists(model_registry.path(LINEAR_FILE)):
+        return None
+    artifact, vectorizer = model_registry.get_many([LINEAR_FILE, VECTORIZER_FILE])
+
+    if _linear["artifact"] is not artifact:
+        scorer = LinearScorer(artifact)
+        if scorer.n_features != len(vectorizer.vocabulary_):
+            # vectorizer retrained without re-exporting the compiled model
+            print(f"⚠️ {LINEAR_FILE} does not match {VECTORIZER_FILE}; using {MODEL_FILE}")
+            scorer = None
+        _linear["artifact"], _linear["scorer"] = artifact, scorer
+
+    if _linear["scorer"] is None:
+        return None
+    return _linear["scorer"], vectorizer
+
+
+def canonical_symptoms(symptoms: list) -> tuple:
+    """Lowercased, whitespace-collapsed, de-duplicated and sorted: same checkboxes -> same tuple."""
+    return tuple(sorted({" ".join(s.lower().split()) for s in symptoms if s and s.strip()}))
 
-def predict_top(symptoms_text: str, top_k: int = 5):
-    X = _vectorizer.transform([symptoms_text])
 
-    # If model supports predict_proba -> best
-    if hasattr(_model, "predict_proba"):
-        probs = _model.predict_proba(X)[0]  # array
-        top_idx = np.argsort(probs)[::-1][:top_k]
+def symptoms_to_text(symptoms: list) -> str:
+    # selected symptoms -> single text (canonical order: the TF-IDF n-grams
+    # span symptoms, so order would otherwise change the scores)
+    return ", ".join(canonical_symptoms(symptoms))
 
-        diseases = _encoder.inverse_transform(top_idx)
-        results = [{"disease": d, "confidence": float(probs[i])} for d, i in zip(diseases, top_idx)]
-        return results
 
-    # Fallback: only 1 prediction available
-    pred = _model.predict(X)[0]
-    disease = _encoder.inverse_transform([pred])[0]
-    return [{"disease": disease, "confidence": None}]
+def _top_k(probs: np.ndarray, top_k: int) -> np.ndarray:
+    """Column indices of each row's top_k probabilities, best first (argpartition, then sort k)."""
+    k = max(1, min(top_k, probs.shape[1]))
+    idx = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(probs, idx, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)
+
+
+def predict_top_batch(symptoms_texts: List[str], top_k: int = 5) -> List[list]:
+    """predict_top for many texts: one vectorizer.transform, one scoring call."""
+    if not symptoms_texts:
+        return []
+
+    linear = load_linear_scorer()
+    if linear is not None:
+        scorer, vectorizer = linear
+        probs = scorer.predict_proba(vectorizer.transform(symptoms_texts))
+        labels = scorer.labels
+    else:
+        model, vectorizer, encoder = load_symptom_model()
+        X = vectorizer.transform(symptoms_texts)
+
+        # Fallback: only 1 prediction available
+        if not hasattr(model, "predict_proba"):
+            diseases = encoder.inverse_transform(model.predict(X))
+            return [[{"disease": str(d), "confidence": None}] for d in diseases]
+
+        probs = model.predict_proba(X)
+        labels = encoder.inverse_transform(np.arange(probs.shape[1]))
+
+    top = _top_k(probs, top_k)
+    return [
+        [{"disease": str(labels[i]), "confidence": round(float(row[i]), 4)} for i in idx]
+        for row, idx in zip(probs, top)
+    ]
+
+
+def predict_top(symptoms_text: str, top_k: int = 5):
+    return predict_top_batch([symptoms_text], top_k)[0]
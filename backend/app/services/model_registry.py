@@ -0,0 +1,188 @@
+# app/services/model_registry.py
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from typing import Callable, List
+
+import joblib
+import numpy as np
+
+from app.config import settings
+
+# backend/ (where train.py output is deployed)
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _memory_bytes(obj, seen=None) -> tuple[int, int, int]:
+    """
+    (array bytes in memory, memory-mapped array bytes, python object bytes)
+    of a fitted estimator. Python containers (a vectorizer's vocabulary_
+    dict, its strings) are private to each worker: mmap_mode can't share them.
+    """
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0, 0, 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.memmap):
+        return 0, int(obj.nbytes), 0
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            arr, mm, py = int(obj.nbytes), 0, 0
+            for x in obj.ravel():
+                a, b, c = _memory_bytes(x, seen)
+                arr, mm, py = arr + a, mm + b, py + c
+            return arr, mm, py
+        return int(obj.nbytes), 0, 0
+    if hasattr(obj, "tocsr") and hasattr(obj, "data"):  # scipy sparse
+        sizes = [_memory_bytes(getattr(obj, k), seen) for k in ("data", "indices", "indptr") if hasattr(obj, k)]
+        return sum(a for a, _, _ in sizes), sum(b for _, b, _ in sizes), 0
+
+    py = 0
+    children = []
+    if isinstance(obj, dict):
+        py = sys.getsizeof(obj)
+        children = [x for kv in obj.items() for x in kv]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        py = sys.getsizeof(obj)
+        children = list(obj)
+    elif isinstance(obj, (str, bytes, int, float)):
+        return 0, 0, sys.getsizeof(obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        py = sys.getsizeof(obj)
+        children = [vars(obj)]
+
+    arr = mm = 0
+    for c in children:
+        a, b, p = _memory_bytes(c, seen)
+        arr, mm, py = arr + a, mm + b, py + p
+    return arr, mm, py
+
+
+class ModelRegistry:
+    """
+    Process-wide home of the ML artifacts: each file is joblib-loaded once, on
+    first use, with mmap_mode so the large numpy arrays are shared page-cache
+    memory across workers instead of a private copy each.
+
+    Artifacts are reloaded when their files change on disk (checked at most
+    every ML_RELOAD_CHECK_SECONDS); `version` changes with them and
+    on_reload() listeners (e.g. prediction caches) are told.
+    """
+
+    def __init__(self, base_dir: str, mmap_mode: str, check_seconds: int):
+        self.base_dir = base_dir
+        self.mmap_mode = mmap_mode or None
+        self.check_seconds = check_seconds
+
+        self._lock = threading.Lock()
+        self._objects: dict = {}
+        self._info: dict = {}
+        self._stat: dict = {}
+        self._checked_at = 0.0
+        self._listeners: List[Callable[[], None]] = []
+        self.version = "unloaded"
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.base_dir, name)
+
+    @staticmethod
+    def _file_sig(path: str) -> tuple:
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime_ns)
+
+    def _refresh_version(self):
+        raw = "|".join(f"{n}:{s[0]}:{s[1]}" for n, s in sorted(self._stat.items()))
+        self.version = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+    # ---------- load ----------
+    def _load(self, name: str):
+        path = self.path(name)
+        t = time.perf_counter()
+        try:
+            obj = joblib.load(path, mmap_mode=self.mmap_mode)
+        except ValueError:
+            # compressed joblib files can't be memory-mapped
+            obj = joblib.load(path)
+        load_ms = (time.perf_counter() - t) * 1000
+
+        mem, mm, py = _memory_bytes(obj)
+        self._objects[name] = obj
+        self._stat[name] = self._file_sig(path)
+        self._info[name] = {
+            "type": type(obj).__name__,
+            "load_ms": round(load_ms, 1),
+            "file_bytes": self._stat[name][0],
+            "array_bytes": mem,
+            "mmap_bytes": mm,
+            "python_bytes": py,  # dicts / strings: a private copy per worker
+            "loaded_at": time.time(),
+        }
+        self._refresh_version()
+        print(f"📦 loaded {name} ({type(obj).__name__}) in {load_ms:.0f}ms, "
+              f"{(mem + py) / 1e6:.1f}MB in memory ({py / 1e6:.1f}MB python objects) + {mm / 1e6:.1f}MB mapped")
+        return obj
+
+    def _changed(self) -> bool:
+        now = time.time()
+        if self.check_seconds <= 0 or now - self._checked_at < self.check_seconds:
+            return False
+        self._checked_at = now
+        for name, sig in list(self._stat.items()):
+            try:
+                if self._file_sig(self.path(name)) != sig:
+                    return True
+            except OSError:
+                pass  # mid-deploy; keep what we have
+        return False
+
+    def check(self):
+        """Reload if the loaded files changed on disk (rate-limited by check_seconds)."""
+        if self._objects and self._changed():
+            self.reload()
+
+    def get_many(self, names: List[str]) -> tuple:
+        """Artifacts that belong together (model + vectorizer + encoder), from the same load."""
+        self.check()
+        with self._lock:
+            return tuple(
+                self._objects[n] if n in self._objects else self._load(n)
+                for n in names
+            )
+
+    def get(self, name: str):
+        return self.get_many([name])[0]
+
+    def reload(self):
+        """Drop every artifact; the next get() loads fresh copies."""
+        with self._lock:
+            self._objects.clear()
+            self._info.clear()
+            self._stat.clear()
+            self.version = "unloaded"
+        self._notify()
+
+    def on_reload(self, fn: Callable[[], None]):
+        self._listeners.append(fn)
+
+    def _notify(self):
+        print("🔄 model artifacts reloaded")
+        for fn in self._listeners:
+            try:
+                fn()
+            except Exception as e:
+                print("model reload listener failed:", e)
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"version": self.version, "artifacts": {k: dict(v) for k, v in self._info.items()}}
+
+
+model_registry = ModelRegistry(
+    base_dir=settings.ML_MODEL_DIR or BACKEND_DIR,
+    mmap_mode=settings.ML_MMAP_MODE,
+    check_seconds=settings.ML_RELOAD_CHECK_SECONDS,
+)
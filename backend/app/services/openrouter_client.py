@@ -1,11 +1,12 @@
 # app/services/openrouter_client.py
 
-import httpx
-from app.config import settings
+import json
+from typing import AsyncIterator
 
-OPENROUTER_URL = getattr(
-    settings, "OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"
-).rstrip("/")
+from app.config import settings
+from app.services.http_client import openrouter_http
+from app.services.intent_classifier import classify_medical
+from app.services.prompt_builder import count_message_tokens, fit_prompt
 
 LANG_NAME = {
     "en": "English",
@@ -39,48 +40,67 @@ async def _call_openrouter(
     model: str | None = None,
     temperature: float = 0.2,
 ) -> str:
-    headers = {
-        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        # "HTTP-Referer": "http://localhost",
-        # "X-Title": "HealthBot",
+    payload = {
+        "model": model or settings.OPENROUTER_MODEL,
+        "messages": messages,
+        "temperature": temperature,
     }
 
+    r = await openrouter_http.client.post("/chat/completions", json=payload)
+    r.raise_for_status()
+    data = r.json()
+    return data["choices"][0]["message"]["content"].strip()
+
+
+async def _stream_openrouter(
+    messages: list,
+    model: str | None = None,
+    temperature: float = 0.2,
+) -> AsyncIterator[str]:
+    """
+    Same request as _call_openrouter but with stream=true.
+    Yields content deltas as OpenRouter sends them (SSE "data:" lines).
+    """
     payload = {
         "model": model or settings.OPENROUTER_MODEL,
         "messages": messages,
         "temperature": temperature,
+        "stream": True,
     }
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(
-            f"{OPENROUTER_URL}/chat/completions",
-            headers=headers,
-            json=payload,
-        )
+    async with openrouter_http.client.stream("POST", "/chat/completions", json=payload) as r:
         r.raise_for_status()
-        data = r.json()
-        return data["choices"][0]["message"]["content"].strip()
+        async for line in r.aiter_lines():
+            # ": OPENROUTER PROCESSING" keep-alive comments, blank separators
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                continue
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
 
 
 # ----------------------------
 # 1) Medical intent classifier
 # ----------------------------
 async def is_medical_query_openrouter(query: str) -> bool:
-    q = (query or "").strip().lower()
-
-    # ✅ quick keyword allow (prevents misclassification)
-    medical_keywords = [
-        "medicine", "medication", "tablet", "capsule", "syrup", "drug",
-        "dose", "dosage", "prescription", "side effect", "contraindication",
-        "fever", "cough", "cold", "pain", "headache", "bp", "sugar",
-        "infection", "disease", "symptom", "treatment", "diagnosis",
-        "antibiotic", "paracetamol", "ibuprofen", "dolo", "azith",
-        "rash", "vomit", "diarrhea", "asthma", "diabetes", "hypertension",
-        "what is this medicine", "what is this tablet"
-    ]
-    if any(k in q for k in medical_keywords):
-        return True
+    # ✅ local classifier first (phrase automaton + linear model, microseconds)
+    local = classify_medical(query)
+    if local["medical"] is not None:
+        return local["medical"]
+
+    # ✅ low confidence -> optional LLM escalation
+    if not settings.INTENT_LLM_ESCALATION:
+        return local["confidence"] >= 0.5
 
     prompt = f"""
 You are a strict classifier.
@@ -128,21 +148,42 @@ User message: {query}
     return title
 
 
+TITLE_PUNCT = "\"'`.,;:!?()[]{}<>…“”‘’¿¡-"
+
+TITLE_STOPWORDS = {
+    "a", "an", "the", "i", "im", "i'm", "me", "my", "we", "you", "your",
+    "is", "are", "am", "was", "be", "do", "does", "did", "can", "could",
+    "should", "would", "will", "please", "tell", "about", "what", "whats",
+    "how", "why", "when", "which", "who", "to", "of", "for", "in", "on",
+    "and", "or", "it", "this", "that", "have", "has", "had", "hi", "hello",
+}
+
+
+def quick_chat_title(query: str) -> str:
+    """
+    Instant extractive title (no LLM): first few content words of the message.
+    Used as a placeholder while generate_chat_title runs in the background.
+    """
+    # split on whitespace (not \w) so Indic vowel signs stay attached
+    words = [w.strip(TITLE_PUNCT) for w in (query or "").split()]
+    words = [w for w in words if w]
+    keep = [w for w in words if w.lower() not in TITLE_STOPWORDS] or words
+    title = " ".join(keep[:5]).strip()
+    if not title:
+        return "Health Chat"
+    title = title[:1].upper() + title[1:]
+    return title[:60].rstrip()
+
+
 # ----------------------------
 # 3) Main chat (RAG + fallback)
 # ----------------------------
-async def openrouter_chat(
-    model: str,
-    user_message: str,
-    chat_history: list,
-    rag_context: str,
-    language: str,
-) -> str:
+def _system_prompt(language: str) -> str:
     lang_code = (language or "en").strip().lower()
     lang_name = LANG_NAME.get(lang_code, "English")
     lang_rule = LANG_STRICT_RULE.get(lang_code, "Write ONLY in English.")
 
-    system = f"""
+    return f"""
 You are a medical awareness assistant (NOT a doctor).
 Safety rules:
 - Answer only health/medical awareness queries.
@@ -158,17 +199,25 @@ LANGUAGE RULE (VERY IMPORTANT):
 - If the user writes in a different language, still respond ONLY in {lang_name}.
 """.strip()
 
-    # -------- RAG MODE --------
-    if rag_context and len(rag_context.strip()) >= 30:
-        rag_prompt = f"""
-You MUST answer strictly from the context below.
+
+def _has_rag_context(rag_context: str) -> bool:
+    return bool(rag_context and len(rag_context.strip()) >= 30)
+
+
+def _rag_messages(system: str, user_message: str, chat_history: list, rag_context: str) -> list:
+    # one pass: the model decides whether the context covers the question,
+    # so there is never a second "fallback" completion
+    rag_prompt = f"""
+Answer using the context below when it covers the question.
 
 IMPORTANT RULES:
 - If medicine name appears → mention it clearly.
 - If tablet/drug info present → explain its use.
-- Do NOT give generic medicine examples.
-- Do NOT guess.
-- If answer missing → reply EXACTLY: NO_CONTEXT
+- Do NOT give generic medicine examples when the context names the medicine.
+- Do NOT guess details that are not in the context.
+- If the context does NOT cover the question → do not mention the context;
+  give SAFE, GENERAL guidance instead (basic home remedies if applicable,
+  common OTC medicines without dosage, when to consult a doctor).
 
 Context:
 {rag_context}
@@ -179,16 +228,47 @@ User question:
 Answer:
 """
 
+    messages = [{"role": "system", "content": system}]
+    messages.extend(chat_history)
+    messages.append({"role": "user", "content": rag_prompt})
+    return messages
 
-        messages = [{"role": "system", "content": system}]
-        messages.extend(chat_history[-10:])
-        messages.append({"role": "user", "content": rag_prompt})
 
-        answer = await _call_openrouter(messages=messages, model=model, temperature=0.2)
-        if answer.strip() != "NO_CONTEXT":
-            return answer.strip()
+def _plan_rag_messages(
+    model: str,
+    system: str,
+    user_message: str,
+    chat_history: list,
+    rag_context: list[str] | str,
+) -> list | None:
+    """
+    Fits history + RAG chunks into the model's token budget (most recent turns,
+    best-ranked chunks). Returns None when no usable context survives.
+    """
+    chunks = [rag_context] if isinstance(rag_context, str) else list(rag_context or [])
+    chunks = [c for c in chunks if c and c.strip()]
+    if not chunks:
+        return None
+
+    fixed = "\n".join(m["content"] for m in _rag_messages(system, user_message, [], ""))
+    plan = fit_prompt(model, fixed, chat_history, chunks)
+
+    context = "\n\n".join(plan["chunks"]).strip()
+    if not _has_rag_context(context):
+        return None
+
+    messages = _rag_messages(system, user_message, plan["history"], context)
+    _log_prompt("rag", messages, model, plan["budget"],
+                f"{len(plan['chunks'])}/{len(chunks)} chunks, {len(plan['history'])}/{len(chat_history)} turns")
+    return messages
+
 
-    # -------- FALLBACK MODE --------
+def _log_prompt(mode: str, messages: list, model: str, budget: int, extra: str = ""):
+    tokens = count_message_tokens(messages, model)
+    print(f"🧮 prompt[{mode}] {tokens} tokens (budget {budget}) {extra}".rstrip())
+
+
+def _fallback_messages(system: str, user_message: str, chat_history: list) -> list:
     emergency_prompt = f"""
 The user asked a medical question, but reliable book context was missing.
 
@@ -207,8 +287,52 @@ User Question:
 Answer:
 """.strip()
 
-    messages = [
-        {"role": "system", "content": system},
-        {"role": "user", "content": emergency_prompt},
-    ]
-    return await _call_openrouter(messages=messages, model=model, temperature=0.2)
+    messages = [{"role": "system", "content": system}]
+    messages.extend(chat_history)
+    messages.append({"role": "user", "content": emergency_prompt})
+    return messages
+
+
+def _plan_messages(model: str, system: str, user_message: str, chat_history: list, rag_context: list[str] | str) -> list:
+    # -------- RAG MODE (relevant chunks found) --------
+    messages = _plan_rag_messages(model, system, user_message, chat_history, rag_context)
+    if messages:
+        return messages
+
+    # -------- FALLBACK MODE (nothing above the retrieval threshold) --------
+    # keeps the budgeted history: follow-ups ("what about for children?") need it
+    fixed = "\n".join(m["content"] for m in _fallback_messages(system, user_message, []))
+    plan = fit_prompt(model, fixed, chat_history, [])
+    messages = _fallback_messages(system, user_message, plan["history"])
+    _log_prompt("fallback", messages, model, plan["budget"],
+                f"{len(plan['history'])}/{len(chat_history)} turns")
+    return messages
+
+
+async def openrouter_chat(
+    model: str,
+    user_message: str,
+    chat_history: list,
+    rag_context: list[str] | str,
+    language: str,
+) -> str:
+    system = _system_prompt(language)
+
+    messages = _plan_messages(model, system, user_message, chat_history, rag_context)
+    answer = await _call_openrouter(messages=messages, model=model, temperature=0.2)
+    return answer.strip()
+
+
+async def openrouter_chat_stream(
+    model: str,
+    user_message: str,
+    chat_history: list,
+    rag_context: list[str] | str,
+    language: str,
+) -> AsyncIterator[str]:
+    """Streaming twin of openrouter_chat: yields answer text as it is generated."""
+    system = _system_prompt(language)
+
+    messages = _plan_messages(model, system, user_message, chat_history, rag_context)
+    async for delta in _stream_openrouter(messages=messages, model=model, temperature=0.2):
+        yield delta
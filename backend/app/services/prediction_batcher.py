@@ -0,0 +1,152 @@
+# app/services/prediction_batcher.py
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from app.config import settings
+from app.services.ml_predictor import predict_top_batch
+
+
+class PredictionBatcher:
+    """
+    Micro-batching for /symptom/predict-ml: concurrent calls wait up to
+    window_ms for company, then the whole batch is vectorized + scored in
+    one predict_top_batch call on a worker thread and each caller's future
+    gets its own rows.
+
+    Scoring has its own thread rather than the shared request threadpool:
+    callers awaiting a batch still hold their DB session, and a burst can
+    fill that pool with requests waiting for a connection.
+
+    One batch is scored at a time; calls arriving meanwhile queue up and go
+    out together as the next batch, so under a burst the batch size grows
+    instead of the number of scoring calls. A batch is sent early once
+    max_batch calls are waiting.
+    """
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._full: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "max_batch_seen": 0, "score_seconds": 0.0}
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ml-batch")
+            return self._executor
+
+    @staticmethod
+    def _timed(texts: List[str], top_k: int) -> tuple[List[list], float]:
+        started = time.perf_counter()
+        return predict_top_batch(texts, top_k), time.perf_counter() - started
+
+    async def _predict_batch(self, texts: List[str], top_k: int) -> List[list]:
+        results, seconds = await asyncio.get_running_loop().run_in_executor(self._pool(), self._timed, texts, top_k)
+        self._count(len(texts), seconds)
+        return results
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            # first call, or a new event loop (reload / tests): fresh queue + worker
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._full = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    async def predict(self, symptoms_text: str, top_k: int) -> list:
+        if self.window <= 0 or self.max_batch <= 1:
+            return (await self._predict_batch([symptoms_text], top_k))[0]
+
+        self._ensure_worker()
+        fut = self._loop.create_future()
+        self._queue.put_nowait((symptoms_text, top_k, fut))
+        if self._queue.qsize() >= self.max_batch:
+            self._full.set()
+        return await fut
+
+    # ---------- worker ----------
+    async def _run(self):
+        queue = self._queue
+        while True:
+            first = await queue.get()
+            if queue.qsize() + 1 < self.max_batch:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = [first]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            await self._score(batch)
+
+    async def _score(self, batch: List[tuple]):
+        batch = [item for item in batch if not item[2].done()]  # caller gone
+        if not batch:
+            return
+        texts = [text for text, _, _ in batch]
+        k = max(top_k for _, top_k, _ in batch)
+
+        try:
+            results = await self._predict_batch(texts, k)
+        except Exception as e:
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for (_, top_k, fut), preds in zip(batch, results):
+            if not fut.done():
+                fut.set_result(preds[:top_k])
+
+    # ---------- stats / lifecycle ----------
+    def _count(self, n: int, seconds: float):
+        with self._lock:
+            self._stats["requests"] += n
+            self._stats["batches"] += 1
+            self._stats["max_batch_seen"] = max(self._stats["max_batch_seen"], n)
+            self._stats["score_seconds"] += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        s["score_seconds"] = round(s["score_seconds"], 3)
+        s["avg_batch"] = round(s["requests"] / s["batches"], 2) if s["batches"] else 0.0
+        s["window_ms"] = self.window * 1000
+        s["max_batch"] = self.max_batch
+        return s
+
+    async def aclose(self):
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        while self._queue is not None and not self._queue.empty():
+            _, _, fut = self._queue.get_nowait()
+            fut.cancel()
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+prediction_batcher = PredictionBatcher(
+    window_ms=settings.ML_MICROBATCH_WINDOW_MS,
+    max_batch=settings.ML_MICROBATCH_MAX,
+)
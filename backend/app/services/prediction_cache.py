@@ -0,0 +1,78 @@
+# app/services/prediction_cache.py
+
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import settings
+from app.services.model_registry import model_registry
+
+
+class PredictionCache:
+    """
+    LRU cache of symptom predictions keyed by (model version, top_k,
+    canonical symptom text) — symptoms_to_text sorts and de-duplicates, so
+    the same checkboxes in any order share an entry.
+
+    Cleared when the model registry reloads. A result computed across a
+    reload is not stored: get() hands out a generation and put() drops the
+    result if the cache was cleared since.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[tuple, list]" = OrderedDict()
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _key(symptoms_text: str, top_k: int) -> tuple:
+        return (model_registry.version, top_k, symptoms_text)
+
+    def get(self, symptoms_text: str, top_k: int) -> tuple[Optional[list], int]:
+        """(cached predictions or None, generation to hand back to put())."""
+        if self.max_entries <= 0:
+            return None, self._generation
+        model_registry.check()  # a hit never loads the model, so look for new files here
+        key = self._key(symptoms_text, top_k)
+        with self._lock:
+            preds = self._mem.get(key)
+            if preds is None:
+                self._stats["misses"] += 1
+            else:
+                self._mem.move_to_end(key)
+                self._stats["hits"] += 1
+            return preds, self._generation
+
+    def put(self, symptoms_text: str, top_k: int, preds: list, generation: int):
+        if self.max_entries <= 0:
+            return
+        key = self._key(symptoms_text, top_k)
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._mem[key] = preds
+            self._mem.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._mem.clear()
+            self._generation += 1
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["size"] = len(self._mem)
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = round(s["hits"] / lookups, 4) if lookups else 0.0
+        return s
+
+
+prediction_cache = PredictionCache(max_entries=settings.ML_PREDICTION_CACHE_SIZE)
+model_registry.on_reload(prediction_cache.invalidate)
@@ -0,0 +1,116 @@
+# app/services/prompt_builder.py
+
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+from app.config import settings
+
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+
+# ---------------------------
+# Token counting
+# ---------------------------
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    """tiktoken encoding for an OpenRouter model id ("openai/gpt-4o-mini"), or None."""
+    if tiktoken is None:
+        return None
+    name = (model or "").split("/")[-1]
+    try:
+        return tiktoken.encoding_for_model(name)
+    except KeyError:
+        pass
+    except Exception as e:
+        # e.g. BPE file download blocked -> heuristic counting
+        print("⚠️ tiktoken unavailable, estimating tokens:", e)
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    enc = _encoding(model or settings.OPENROUTER_MODEL)
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+
+    # fallback estimate: BPE splits long/non-Latin words into several pieces
+    est = 0
+    for tok in _TOKEN_RE.findall(text):
+        est += 1 if tok.isascii() else max(1, len(tok) // 2)
+        if tok.isascii() and len(tok) > 8:
+            est += len(tok) // 8
+    return est
+
+
+def count_message_tokens(messages: List[dict], model: Optional[str] = None) -> int:
+    # ~4 tokens of chat-format overhead per message + 2 for the reply primer
+    return sum(4 + count_tokens(m.get("content") or "", model) for m in messages) + 2
+
+
+def token_budget(model: str) -> int:
+    return int(settings.PROMPT_TOKEN_BUDGETS.get(model, settings.PROMPT_TOKEN_BUDGET))
+
+
+# ---------------------------
+# Budget fitting
+# ---------------------------
+def fit_prompt(
+    model: str,
+    fixed_text: str,
+    history: List[dict],
+    chunks: List[str],
+) -> dict:
+    """
+    Choose what goes into the prompt under the model's token budget.
+
+    fixed_text: everything that is always sent (system prompt, template, question).
+    history:    chat turns, oldest -> newest; the most recent ones are kept.
+    chunks:     RAG chunks, best match first; the highest ranked are kept.
+
+    Context gets first claim on PROMPT_CONTEXT_SHARE of what's left after the
+    fixed part; history gets the rest (plus whatever context didn't use).
+    Returns {"history", "chunks", "tokens", "budget"}.
+    """
+    budget = token_budget(model)
+    used = count_tokens(fixed_text, model) + 10
+    remaining = max(0, budget - used)
+
+    kept_chunks: List[str] = []
+    ctx_limit = int(remaining * settings.PROMPT_CONTEXT_SHARE)
+    ctx_used = 0
+    for ch in chunks:
+        n = count_tokens(ch, model) + 2
+        if ctx_used + n > ctx_limit:
+            break
+        kept_chunks.append(ch)
+        ctx_used += n
+    remaining -= ctx_used
+
+    kept_history: List[dict] = []
+    hist_used = 0
+    for m in reversed(history):
+        n = count_tokens(m.get("content") or "", model) + 4
+        if hist_used + n > remaining:
+            break
+        kept_history.append(m)
+        hist_used += n
+    kept_history.reverse()
+
+    return {
+        "history": kept_history,
+        "chunks": kept_chunks,
+        "tokens": used + ctx_used + hist_used,
+        "budget": budget,
+    }
@@ -0,0 +1,139 @@
+# app/services/retrieval_planner.py
+
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import func
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Document
+
+ACTIVE_STATUSES = ("queued", "extracting", "embedding")
+
+
+class DocRegistry:
+    """
+    Cached per-chat upload state: {"count", "ready", "pending", "failed",
+    "chunks", "last_status"}. Loaded with one aggregate query on a miss and
+    invalidated whenever an upload is created or changes status; the TTL
+    covers changes made by other processes.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._state: dict[int, tuple[float, dict]] = {}
+        self._stats = {"hits": 0, "misses": 0}
+
+    def _load(self, chat_id: int) -> dict:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(Document.status, func.count(Document.id), func.coalesce(func.sum(Document.chunks), 0))
+                .filter(Document.chat_id == chat_id)
+                .group_by(Document.status)
+                .all()
+            )
+            last = (
+                db.query(Document.status)
+                .filter(Document.chat_id == chat_id)
+                .order_by(Document.id.desc())
+                .first()
+            )
+        finally:
+            db.close()
+
+        state = {"count": 0, "ready": 0, "pending": 0, "failed": 0, "chunks": 0,
+                 "last_status": last[0] if last else None}
+        for status, n, chunks in rows:
+            state["count"] += n
+            if status == "ready":
+                state["ready"] += n
+                state["chunks"] += int(chunks or 0)
+            elif status in ACTIVE_STATUSES:
+                state["pending"] += n
+            elif status == "failed":
+                state["failed"] += n
+        return state
+
+    def get(self, chat_id: int) -> dict:
+        now = time.time()
+        with self._lock:
+            hit = self._state.get(chat_id)
+            if hit and now - hit[0] < self.ttl:
+                self._stats["hits"] += 1
+                return hit[1]
+            self._stats["misses"] += 1
+
+        state = self._load(chat_id)
+        with self._lock:
+            self._state[chat_id] = (now, state)
+            if len(self._state) > settings.DOC_REGISTRY_MAX_CHATS:
+                oldest = min(self._state, key=lambda k: self._state[k][0])
+                self._state.pop(oldest, None)
+        return state
+
+    def invalidate(self, chat_id: Optional[int]):
+        if chat_id is None:
+            return
+        with self._lock:
+            self._state.pop(chat_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["size"] = len(self._state)
+        return s
+
+
+doc_registry = DocRegistry(ttl_seconds=settings.DOC_REGISTRY_TTL_SECONDS)
+
+_decisions: dict[str, int] = {}
+_decisions_lock = threading.Lock()
+
+
+def plan_retrieval(chat_id: int, doc_question: bool) -> dict:
+    """
+    Which namespaces this turn should query, from the chat's upload state.
+    Returns {"sources", "decision", "docs"}; the decision is logged + counted.
+      chat_only    : question about an upload and the chat has ready uploads
+      chat+global  : ready uploads, general question
+      global_only  : no ready uploads (none at all / still ingesting / failed)
+    """
+    docs = doc_registry.get(chat_id)
+    global_ns = getattr(settings, "PINECONE_NAMESPACE", "global-medical")
+
+    chat_src = {
+        "namespace": f"chat-{chat_id}",
+        "weight": settings.RAG_CHAT_WEIGHT,
+        "quota": settings.RAG_CHAT_QUOTA,
+        "min_score": settings.RAG_MIN_SCORE_CHAT,
+    }
+    global_src = {
+        "namespace": global_ns,
+        "weight": settings.RAG_GLOBAL_WEIGHT,
+        "quota": settings.RAG_GLOBAL_QUOTA,
+        "min_score": settings.RAG_MIN_SCORE,
+    }
+
+    if docs["ready"] and docs["chunks"] and doc_question:
+        # "summarize my report": the upload is relevant whatever the score
+        decision, sources = "chat_only", [dict(chat_src, min_score=0.0)]
+    elif docs["ready"] and docs["chunks"]:
+        decision, sources = "chat+global", [chat_src, global_src]
+    else:
+        decision, sources = "global_only", [global_src]
+
+    with _decisions_lock:
+        _decisions[decision] = _decisions.get(decision, 0) + 1
+    print(f"🧭 retrieval chat {chat_id}: {decision} "
+          f"(docs {docs['count']}, ready {docs['ready']}, pending {docs['pending']}, chunks {docs['chunks']})")
+    return {"sources": sources, "decision": decision, "docs": docs}
+
+
+def planner_stats() -> dict:
+    with _decisions_lock:
+        decisions = dict(_decisions)
+    return {"decisions": decisions, "registry": doc_registry.stats()}
@@ -1,35 +1,273 @@
-#import easyocr
+# app/utils/ocr.py
+#
+# One OCR engine per process, shared by image uploads and scanned PDF pages.
+# The easyocr model is only loaded the first time something is OCR'd.
+
+import threading
+import time
+from typing import List
+
+import numpy as np
+
+from app.config import settings
+
 try:
     import easyocr
 except Exception:
     easyocr = None
 
-import cv2
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
+
+class OCREngine:
+    def __init__(self, langs: List[str], gpu: bool, max_concurrency: int, threads: int, batch_size: int):
+        self.langs = langs
+        self.gpu = gpu
+        self.threads = threads
+        self.batch_size = max(1, batch_size)
+        self._reader = None
+        self._failed = False
+        self._init_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+
+    @property
+    def available(self) -> bool:
+        return easyocr is not None and not self._failed
+
+    def configure_threads(self, n: int):
+        """torch + OpenCV thread pools; keeps concurrent OCR jobs from oversubscribing cores."""
+        if n <= 0:
+            return
+        try:
+            import torch
+            torch.set_num_threads(n)
+        except Exception:
+            pass
+        if cv2 is not None:
+            cv2.setNumThreads(n)
+
+    def reader(self):
+        if self._reader is not None or not self.available:
+            return self._reader
+        with self._init_lock:
+            if self._reader is None and not self._failed:
+                try:
+                    self.configure_threads(self.threads)
+                    self._reader = easyocr.Reader(self.langs, gpu=self.gpu)
+                    print(f"✅ OCR engine loaded ({','.join(self.langs)}, gpu={self.gpu})")
+                except Exception as e:
+                    print("OCR engine failed to load:", e)
+                    self._failed = True
+        return self._reader
+
+    # ---------- recognition ----------
+    def recognize(self, img: np.ndarray) -> str:
+        return self.recognize_batch([img])[0]
+
+    def recognize_batch(self, images: List[np.ndarray]) -> List[str]:
+        """
+        OCR several images in one call. Same-sized images (e.g. PDF pages at a
+        fixed dpi) go through easyocr's batched recognizer.
+        """
+        if not images:
+            return []
+        reader = self.reader()
+        if reader is None:
+            return [""] * len(images)
+
+        with self._slots:
+            if len(images) > 1 and len({im.shape[:2] for im in images}) == 1:
+                results = reader.readtext_batched(images, batch_size=self.batch_size, detail=0)
+            else:
+                results = [reader.readtext(im, detail=0, batch_size=self.batch_size) for im in images]
+        return [" ".join(r) for r in results]
+
+
+ocr_engine = OCREngine(
+    langs=settings.OCR_LANGS,
+    gpu=settings.OCR_GPU,
+    max_concurrency=settings.OCR_MAX_CONCURRENCY,
+    threads=settings.OCR_THREADS,
+    batch_size=settings.OCR_BATCH_SIZE,
+)
+
+
+# ---------------------------
+# Preprocessing (grayscale -> crop -> deskew -> resize to target text height)
+# ---------------------------
+def _load_gray(path: str):
+    if cv2 is not None:
+        return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    try:
+        from PIL import Image
+        with Image.open(path) as im:
+            return np.asarray(im.convert("L"))
+    except Exception:
+        return None
+
+
+def _otsu(gray: np.ndarray) -> int:
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    if np.count_nonzero(hist) < 2:
+        # one grey level (blank scan, solid photo): no two classes to split
+        return int(np.argmax(hist))
+    levels = np.arange(256)
+    w0 = np.cumsum(hist)
+    m0 = np.cumsum(hist * levels)
+    w1 = total - w0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (m0[-1] * w0 / total - m0) ** 2 / (w0 * w1)
+    return int(np.nanargmax(between))
+
+
+def _ink_mask(gray: np.ndarray) -> np.ndarray:
+    """True where there is text; assumes dark text on light paper (inverts otherwise)."""
+    mask = gray <= _otsu(gray)  # Otsu: level t belongs to the dark class
+    if mask.mean() > 0.5:
+        mask = ~mask
+    return mask
+
+
+def _text_bbox(mask: np.ndarray, margin: int):
+    rows = np.where(mask.mean(axis=1) > 0.002)[0]
+    cols = np.where(mask.mean(axis=0) > 0.002)[0]
+    if rows.size == 0 or cols.size == 0:
+        return None
+    h, w = mask.shape
+    return (
+        max(0, rows[0] - margin), min(h, rows[-1] + 1 + margin),
+        max(0, cols[0] - margin), min(w, cols[-1] + 1 + margin),
+    )
+
+
+def _text_height(mask: np.ndarray):
+    """Median height of text lines from the horizontal ink profile, or None."""
+    rows = mask.mean(axis=1) > 0.01
+    edges = np.diff(np.concatenate(([0], rows.astype(np.int8), [0])))
+    starts = np.where(edges == 1)[0]
+    ends = np.where(edges == -1)[0]
+    runs = (ends - starts)[(ends - starts) >= 2]
+    if runs.size == 0:
+        return None
+    return float(np.median(runs))
+
+
+def _deskew(gray: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    pts = np.column_stack(np.where(mask))[:, ::-1].astype(np.float32)
+    if len(pts) < 50:
+        return gray
+    angle = cv2.minAreaRect(pts)[-1]
+    if angle > 45:
+        angle -= 90
+    if abs(angle) < 0.5 or abs(angle) > 20:
+        return gray
+    h, w = gray.shape
+    m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(gray, m, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def _resize(gray: np.ndarray, scale: float) -> np.ndarray:
+    h, w = gray.shape
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    if cv2 is not None:
+        interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        return cv2.resize(gray, size, interpolation=interp)
+    from PIL import Image
+    return np.asarray(Image.fromarray(gray).resize(size, Image.LANCZOS))
+
+
+def preprocess_image(gray: np.ndarray) -> tuple[np.ndarray, dict]:
+    """
+    Returns (image for OCR, info). Text height is measured on a small copy, then
+    the image is scaled so lines are ~OCR_TARGET_TEXT_PX tall, capped at
+    OCR_MAX_PIXELS. info has the scale, estimated text height and ms per stage.
+    """
+    timings = {}
+    t = time.perf_counter()
+
+    # analysis on a <=1000px copy: enough for line heights, cheap on 12MP photos
+    step = max(1, max(gray.shape) // 1000)
+    small = gray[::step, ::step]
+    mask = _ink_mask(small)
+    timings["analyze"] = (time.perf_counter() - t) * 1000
+
+    if small.min() == small.max():
+        # a single grey level has no text to crop to or measure: OCR as is
+        info = {
+            "scale": 1.0,
+            "text_px": None,
+            "shape": gray.shape,
+            "ms": {k: round(v, 1) for k, v in timings.items()},
+        }
+        return np.ascontiguousarray(gray), info
+
+    if settings.OCR_CROP:
+        t = time.perf_counter()
+        box = _text_bbox(mask, margin=8)
+        if box:
+            r0, r1, c0, c1 = box
+            gray = gray[r0 * step : r1 * step, c0 * step : c1 * step]
+            mask = mask[r0:r1, c0:c1]
+        timings["crop"] = (time.perf_counter() - t) * 1000
+
+    if settings.OCR_DESKEW and cv2 is not None:
+        t = time.perf_counter()
+        gray = _deskew(gray, cv2.resize(mask.astype(np.uint8), gray.shape[::-1]) > 0)
+        timings["deskew"] = (time.perf_counter() - t) * 1000
 
-# load reader once
-_reader = easyocr.Reader(['en'], gpu=False) if easyocr else None
+    t = time.perf_counter()
+    text_h = _text_height(mask)
+    text_h = text_h * step if text_h else None
+    scale = settings.OCR_TARGET_TEXT_PX / text_h if text_h else 1.0
+    scale = min(scale, settings.OCR_MAX_UPSCALE)
+    h, w = gray.shape
+    if h * w * scale * scale > settings.OCR_MAX_PIXELS:
+        scale = (settings.OCR_MAX_PIXELS / (h * w)) ** 0.5
+    if abs(scale - 1.0) > 0.1:
+        gray = _resize(gray, scale)
+    timings["resize"] = (time.perf_counter() - t) * 1000
 
+    info = {
+        "scale": round(scale, 3),
+        "text_px": round(text_h, 1) if text_h else None,
+        "shape": gray.shape,
+        "ms": {k: round(v, 1) for k, v in timings.items()},
+    }
+    return np.ascontiguousarray(gray), info
 
 
 def extract_text_from_image(path: str) -> str:
-    if _reader is None:
+    if not ocr_engine.available:
         print("OCR disabled on deployment")
         return ""
 
     try:
-        # read image
-        img = cv2.imread(path)
-        if img is None:
+        t = time.perf_counter()
+        gray = _load_gray(path)
+        if gray is None:
             print("Image not found:", path)
             return ""
+        load_ms = (time.perf_counter() - t) * 1000
 
-        # improve OCR accuracy
-        img = cv2.resize(img, None, fx=2, fy=2)
+        img, info = preprocess_image(gray)
 
-        # OCR
-        results = _reader.readtext(img, detail=0)
+        t = time.perf_counter()
+        text = ocr_engine.recognize(img)
+        ocr_ms = (time.perf_counter() - t) * 1000
 
-        return " ".join(results)
+        print(
+            f"🖼️ OCR {gray.shape[1]}x{gray.shape[0]} -> {img.shape[1]}x{img.shape[0]} "
+            f"(text ~{info['text_px']}px, x{info['scale']}) load {load_ms:.0f}ms "
+            + " ".join(f"{k} {v:.0f}ms" for k, v in info["ms"].items())
+            + f" ocr {ocr_ms:.0f}ms"
+        )
+        return text
 
     except Exception as e:
         print("OCR error:", e)
@@ -3,6 +3,7 @@ import numpy as np
 import joblib
 import re
 import os
+import sys
 import json
 import matplotlib.pyplot as plt
 
@@ -126,6 +127,16 @@ joblib.dump(vectorizer, "vectorizer.pkl")
 joblib.dump(label_encoder, "label_encoder.pkl")
 print("\nModel Saved Successfully!")
 
+# ---------------------------
+# Export compiled model (served by the backend, no sklearn unpickling)
+# ---------------------------
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.linear_scorer import export_linear
+
+linear_info = export_linear(model, label_encoder, "disease_linear.pkl", X_check=X_test, atol=1e-6)
+print("Compiled model saved: disease_linear.pkl (max |p - predict_proba| =",
+      f"{linear_info['max_abs_diff']:.2e} on the test split)")
+
 # ---------------------------
 # Save metrics as JSON (for reports page)
 # ---------------------------
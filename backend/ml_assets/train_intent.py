@@ -0,0 +1,101 @@
+import pandas as pd
+import numpy as np
+import joblib
+import json
+import os
+
+from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.pipeline import Pipeline, FeatureUnion
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, classification_report
+
+# ---------------------------
+# Medical-intent classifier (used by app/services/intent_classifier.py)
+# Run from backend/ml_assets:  python train_intent.py
+# ---------------------------
+OUT_DIR = "outputs"
+os.makedirs(OUT_DIR, exist_ok=True)
+
+# ---------------------------
+# Load dataset
+# intent_data.csv: hand-labelled questions (medical / other)
+# Symptom2Disease.csv: symptom descriptions + disease names -> extra "medical" examples
+# ---------------------------
+df = pd.read_csv("intent_data.csv")
+
+sym_all = pd.read_csv("Symptom2Disease.csv")
+sym = sym_all.sample(n=min(400, len(sym_all)), random_state=42)
+df = pd.concat(
+    [df, pd.DataFrame({"text": sym["text"], "label": "medical"})],
+    ignore_index=True,
+)
+
+# templated questions for every disease label we know about
+templates = [
+    "what is {d}",
+    "symptoms of {d}",
+    "how to treat {d}",
+    "is {d} contagious",
+    "how to prevent {d}",
+]
+diseases = sorted(sym_all["label"].astype(str).str.lower().unique())
+df = pd.concat(
+    [df, pd.DataFrame({"text": [t.format(d=d) for d in diseases for t in templates], "label": "medical"})],
+    ignore_index=True,
+)
+
+df["text"] = df["text"].astype(str).str.lower().str.strip()
+
+X = df["text"]
+y = df["label"]
+
+print("Class counts:")
+print(y.value_counts())
+
+# ---------------------------
+# Word + char n-grams (char n-grams survive typos like "feverr", "hedache")
+# ---------------------------
+features = FeatureUnion([
+    ("word", TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=1)),
+    ("char", TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), sublinear_tf=True, min_df=2)),
+])
+
+model = Pipeline([
+    ("features", features),
+    ("clf", LogisticRegression(C=5, max_iter=2000, class_weight="balanced")),
+])
+
+# ---------------------------
+# Split / train / evaluate
+# ---------------------------
+X_train, X_test, y_train, y_test = train_test_split(
+    X, y, test_size=0.2, random_state=42, stratify=y
+)
+
+model.fit(X_train, y_train)
+y_pred = model.predict(X_test)
+acc = accuracy_score(y_test, y_pred)
+
+print("\n==============================")
+print("INTENT ACCURACY:", round(acc * 100, 2), "%")
+print("==============================\n")
+print(classification_report(y_test, y_pred))
+
+cv_scores = cross_val_score(model, X, y, cv=5)
+cv_mean = float(np.mean(cv_scores))
+print("Mean CV Accuracy:", round(cv_mean * 100, 2), "%")
+
+# ---------------------------
+# Final fit on all data + save
+# ---------------------------
+model.fit(X, y)
+joblib.dump(model, "intent_model.pkl")
+print("\nIntent model saved: intent_model.pkl")
+
+with open(os.path.join(OUT_DIR, "intent_metrics.json"), "w", encoding="utf-8") as f:
+    json.dump(
+        {"accuracy": round(float(acc), 6), "cv_mean_accuracy": round(cv_mean, 6)},
+        f,
+        indent=2,
+    )
@@ -404,20 +404,13 @@ async function sendMessage() {
   setSending(true);
 
   try {
-    const out = await api(`/chat/${currentChatId}/send`, {
-      method: "POST",
-      headers: authHeaders(),
-      body: JSON.stringify({ message: text, language: langSel.value }),
-    });
+    const out = await streamReply(text, typing);
 
-    typing.remove();
-    const reply = out.reply || "No response";
-    addBubble("assistant", out.reply || "No response");
     speakText(out.reply || "");
 
-
     if (out.chat_title) updateActiveChatTitleLocally(out.chat_title);
     if (out.updated_at) updateActiveChatTimeFromBackend(out.updated_at);
+    if (out.title_pending) pollChatTitle(currentChatId);
   } catch (e) {
     typing.remove();
     addBubble("assistant", "Error: " + e.message);
@@ -427,6 +420,87 @@ async function sendMessage() {
   }
 }
 
+// ✅ final (LLM) title is generated after the reply -> pick it up when ready
+async function pollChatTitle(chatId, tries = 10) {
+  for (let i = 0; i < tries; i++) {
+    await new Promise((r) => setTimeout(r, 1500));
+    try {
+      const out = await api(`/chat/${chatId}/title`, { headers: authHeaders() });
+      const titleEl = document.querySelector(`.chatitem[data-id="${chatId}"] .chat-title`);
+      if (titleEl && out.title) titleEl.textContent = out.title;
+      if (!out.pending) return;
+    } catch {
+      return;
+    }
+  }
+}
+
+// ✅ SSE reader for /send/stream: fills the bot bubble token by token
+async function streamReply(text, typing) {
+  const res = await fetch(`${API_BASE}/chat/${currentChatId}/send/stream`, {
+    method: "POST",
+    headers: authHeaders(),
+    body: JSON.stringify({ message: text, language: langSel.value }),
+  });
+
+  if (!res.ok) {
+    let msg = "Request failed";
+    try {
+      msg = (await res.json()).detail || msg;
+    } catch {}
+    throw new Error(msg);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  let reply = "";
+  let bubble = null;
+  let done = null;
+
+  while (true) {
+    const { value, done: finished } = await reader.read();
+    if (finished) break;
+    buf += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buf.indexOf("\n\n")) !== -1) {
+      const raw = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+
+      let event = "message";
+      let data = "";
+      raw.split("\n").forEach((line) => {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        if (line.startsWith("data:")) data += line.slice(5).trim();
+      });
+      if (!data) continue;
+      const payload = JSON.parse(data);
+
+      if (event === "delta") {
+        if (!bubble) {
+          typing.remove();
+          addBubble("assistant", "");
+          bubble = messagesEl.lastElementChild;
+        }
+        reply += payload.text || "";
+        bubble.innerHTML = `<div class="doctor-tag">🩺 Doctor</div>${esc(reply)}`;
+        smoothScrollToBottom();
+      } else if (event === "done") {
+        done = payload;
+      } else if (event === "error") {
+        throw new Error(payload.detail || "Request failed");
+      }
+    }
+  }
+
+  if (!bubble) {
+    typing.remove();
+    addBubble("assistant", (done && done.reply) || "No response");
+  }
+  return done || { reply };
+}
+
 sendBtn.addEventListener("click", (e) => {
   e.preventDefault();
   e.stopPropagation();
@@ -474,7 +548,9 @@ fileInput.addEventListener("change", async () => {
         body: fd,
       });
       if (!res.ok) throw new Error("Upload failed");
-      addBubble("assistant", `✅ Uploaded: ${file.name}`);
+      const out = await res.json();
+      addBubble("assistant", `⏳ Uploaded: ${file.name} (processing…)`);
+      watchDocument(currentChatId, out.document_id, file.name, messagesEl.lastElementChild);
     } catch {
       addBubble("assistant", `❌ Upload failed: ${file.name}`);
     }
@@ -482,6 +558,27 @@ fileInput.addEventListener("change", async () => {
   fileInput.value = "";
 });
 
+// ✅ OCR/embedding runs in the background -> poll until ready/failed
+async function watchDocument(chatId, docId, name, bubble) {
+  if (!docId) return;
+  const setText = (t) => {
+    if (bubble) bubble.innerHTML = `<div class="doctor-tag">🩺 Doctor</div>${esc(t)}`;
+  };
+
+  for (let i = 0; i < 200; i++) {
+    await new Promise((r) => setTimeout(r, 2000));
+    let doc;
+    try {
+      doc = await api(`/chat/${chatId}/documents/${docId}`, { headers: authHeaders() });
+    } catch {
+      return;
+    }
+    if (doc.status === "ready") return setText(`✅ Ready: ${name}`);
+    if (doc.status === "failed") return setText(`❌ Processing failed: ${name}`);
+    setText(`⏳ ${name}: ${doc.status}…`);
+  }
+}
+
 /* ---------------- Mic (Speech to Text) ---------------- */
 
 let recog = null;